@@ -3,10 +3,12 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
+from shop.cart import claim_anonymous_cart
+from shop.instrumentation import query_budget
 from .models import UserProfile
-from shop.models import Category
 
 
+@query_budget(2, post=5)
 def register_view(request):
     """User registration view"""
     if request.user.is_authenticated:
@@ -56,12 +58,12 @@ def register_view(request):
         messages.success(request, 'Account created successfully! Please login.')
         return redirect('accounts:login')
     
-    context = {
-        'categories': Category.objects.filter(is_active=True),
-    }
-    return render(request, 'accounts/register.html', context)
+    return render(request, 'accounts/register.html')
 
 
+# Logging in writes the new session and merges a cookie cart: reads, one
+# upsert and a recount
+@query_budget(2, post=16)
 def login_view(request):
     """User login view"""
     if request.user.is_authenticated:
@@ -76,6 +78,7 @@ def login_view(request):
         
         if user is not None:
             login(request, user)
+            claim_anonymous_cart(request, user)
             
             if not remember_me:
                 request.session.set_expiry(0)
@@ -88,12 +91,10 @@ def login_view(request):
             messages.error(request, 'Invalid username or password.')
             return redirect('accounts:login')
     
-    context = {
-        'categories': Category.objects.filter(is_active=True),
-    }
-    return render(request, 'accounts/login.html', context)
+    return render(request, 'accounts/login.html')
 
 
+@query_budget(5)
 @login_required
 def logout_view(request):
     """User logout view"""
@@ -102,6 +103,7 @@ def logout_view(request):
     return redirect('shop:home')
 
 
+@query_budget(9)
 @login_required
 def profile_view(request):
     """User profile view"""
@@ -125,7 +127,4 @@ def profile_view(request):
         messages.success(request, 'Profile updated successfully!')
         return redirect('accounts:profile')
     
-    context = {
-        'categories': Category.objects.filter(is_active=True),
-    }
-    return render(request, 'accounts/profile.html', context)
+    return render(request, 'accounts/profile.html')
@@ -44,12 +44,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shop.instrumentation.RequestTimingMiddleware',
+    'shop.routers.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'shop.cart.AnonymousCartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -57,7 +60,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times renders for RequestTimingMiddleware
+        'BACKEND': 'shop.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,6 +72,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
                 'shop.context_processors.cart_count',
+                'shop.context_processors.categories',
             ],
         },
     },
@@ -79,10 +84,52 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# shop.backends.sqlite3 is Django's SQLite backend with WAL journaling,
+# BEGIN IMMEDIATE transactions and an in-process write queue (see its
+# docstring). Every atomic() block joins that queue, read-only ones
+# included, so keep transactions to the reads that feed a write; don't turn
+# on ATOMIC_REQUESTS. Connections are kept for CONN_MAX_AGE seconds so the
+# PRAGMAs and page cache outlive a single request.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'shop.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # Seconds a write waits for the lock before "database is locked"
+            'timeout': 20,
+        },
+    }
+}
+
+# Read replicas for catalog and order-history reads (see shop.routers), as a
+# comma-separated list of aliases. Locally, DATABASE_REPLICAS=replica reads
+# from db.replica.sqlite3, refreshed from the primary by `sync_replica`.
+DATABASE_REPLICAS = [alias for alias in os.environ.get('DATABASE_REPLICAS', '').split(',') if alias]
+for alias in DATABASE_REPLICAS:
+    DATABASES.setdefault(alias, {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'db.{alias}.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    })
+
+DATABASE_ROUTERS = ['shop.routers.ReplicaRouter']
+
+# Seconds a browser reads from the primary after it writes, so people see
+# their own changes before the replicas catch up
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Per-process memory cache for development; point this at a shared backend
+# (Redis or Memcached) in production so all workers see the same entries.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'southside',
     }
 }
 
@@ -125,6 +172,17 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic fingerprints file names and writes .gz/.br copies; with DEBUG
+# off they are served by shop.assets (see config/urls.py).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'shop.assets.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Media files (User uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -140,6 +198,47 @@ DEFAULT_FROM_EMAIL = 'orders@southside.com'
 STRIPE_PUBLIC_KEY = 'pk_test_51ExamplePublicKey123456789'
 STRIPE_SECRET_KEY = 'sk_test_51ExampleSecretKey123456789'
 
+# Payment gateway used by checkout. Swap in 'shop.payments.FakeGateway'
+# (OPTIONS: latency, decline_sources) to run without Stripe.
+PAYMENT_GATEWAY = {
+    'BACKEND': 'shop.payments.StripeGateway',
+    'OPTIONS': {'api_key': STRIPE_SECRET_KEY},
+}
+
+# Per-request query and template timing (shop.instrumentation). Timings go
+# to the shop.requests logger; views over their query budget log a warning.
+# SERVER_TIMING also sends them to the browser, so keep it off in production.
+SERVER_TIMING = DEBUG
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'shop.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+# Sessions (see shop.sessions). SESSION_WRITE_BEHIND adds a per-worker LRU
+# in front of the cache and writes changes back to the database in batches;
+# it needs CACHES to be shared by every process, which is checked at
+# startup. Off, sessions are written through as with cached_db. Purge
+# expired rows with `manage.py purge_sessions`.
+SESSION_ENGINE = 'shop.sessions'
+SESSION_WRITE_BEHIND = False
+SESSION_LOCAL_CACHE_SIZE = 10000
+SESSION_WRITE_BEHIND_SECONDS = 5
+SESSION_WRITE_BEHIND_BATCH = 500
+
+# Logged-out carts are kept in a signed cookie (shop.cart) for this long
+ANONYMOUS_CART_COOKIE_AGE = 60 * 60 * 24 * 14
+
 # Login URL
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
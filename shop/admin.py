@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from django.utils.html import format_html, format_html_join
+from .models import Category, Product, Cart, CartItem, Order, OutboundEmail, ProductRanking
 
 
 @admin.register(Category)
@@ -21,25 +22,21 @@ class ProductAdmin(admin.ModelAdmin):
     list_per_page = 50
 
 
-class OrderItemInline(admin.TabularInline):
-    model = OrderItem
-    extra = 0
-    readonly_fields = ['product', 'quantity', 'price_snapshot', 'total_price']
-
-
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'user', 'status', 'payment_status', 'total_amount', 'created_at']
     list_filter = ['status', 'payment_status', 'created_at']
     search_fields = ['order_number', 'user__username', 'user__email']
-    readonly_fields = ['order_number', 'created_at', 'updated_at']
-    inlines = [OrderItemInline]
+    readonly_fields = ['order_number', 'line_items', 'created_at', 'updated_at']
     list_per_page = 50
 
     fieldsets = (
         ('Order Information', {
             'fields': ('order_number', 'user', 'status', 'payment_status', 'total_amount')
         }),
+        ('Items', {
+            'fields': ('line_items',)
+        }),
         ('Delivery Information', {
             'fields': ('delivery_name', 'delivery_address', 'delivery_city', 'delivery_state', 
                       'delivery_postal_code', 'delivery_phone')
@@ -52,14 +49,59 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    @admin.display(description='Line items')
+    def line_items(self, obj):
+        """Order lines rendered from the placement snapshot"""
+        lines = obj.snapshot.get('lines', [])
+        if not lines:
+            return '-'
+        rows = format_html_join(
+            '', '<tr><td>{}</td><td>{}</td><td>₹{}</td><td>₹{}</td></tr>',
+            ((line['name'], line['quantity'], line['price'], line['total']) for line in lines),
+        )
+        return format_html(
+            '<table><thead><tr><th>Product</th><th>Quantity</th><th>Price</th><th>Total</th></tr>'
+            '</thead><tbody>{}</tbody></table>',
+            rows,
+        )
+
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['user', 'total_items', 'subtotal', 'created_at']
     search_fields = ['user__username']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user').with_totals()
+
+    @admin.display(description='Total items', ordering='item_count')
+    def total_items(self, obj):
+        return obj.item_count
+
+    @admin.display(description='Subtotal', ordering='subtotal_amount')
+    def subtotal(self, obj):
+        return obj.subtotal_amount
+
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'total_price']
     list_filter = ['added_at']
+    list_select_related = ['cart__user', 'product']
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'order__order_number']
+    readonly_fields = ['order', 'created_at', 'sent_at', 'last_error']
+    list_per_page = 50
+
+
+@admin.register(ProductRanking)
+class ProductRankingAdmin(admin.ModelAdmin):
+    list_display = ['position', 'product', 'category', 'window', 'units_sold', 'revenue', 'computed_at']
+    list_filter = ['window', 'category']
+    list_select_related = ['product', 'category']
+    list_per_page = 50
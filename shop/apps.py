@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ShopConfig(AppConfig):
     name = 'shop'
+
+    def ready(self):
+        from . import instrumentation, sessions, signals  # noqa: F401
+        sessions.check_shared_cache()
@@ -0,0 +1,209 @@
+"""In-process serving of static and media files for production.
+
+``CompressedManifestStaticFilesStorage`` fingerprints file names during
+``collectstatic`` and writes ``.gz`` (and, with the optional ``brotli``
+package, ``.br``) copies of text assets next to them. ``serve_static`` and
+``serve_media`` pick the best encoding the client accepts, answer
+conditional and single-range requests, and hand the open file to
+``FileResponse`` so WSGI servers can send it with ``sendfile()`` instead of
+reading it through Python. Fingerprinted static files and the content-hashed
+image copies under ``media/derivatives`` are cached for a year; anything
+else is revalidated hourly.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .images import DERIVATIVES_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.svg', '.json', '.map', '.txt', '.xml', '.html', '.ico')
+
+# Only keep a compressed copy that saves at least this fraction of the size
+MIN_SAVING = 0.05
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=3600'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes precompressed copies of text assets"""
+
+    encoders = [('gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli:
+        encoders.append(('br', lambda data: brotli.compress(data, quality=11)))
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        for suffix, encode in self.encoders:
+            path = self.path(f'{name}.{suffix}')
+            if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(self.path(name)):
+                continue
+            encoded = encode(data)
+            if len(encoded) <= len(data) * (1 - MIN_SAVING):
+                with open(path, 'wb') as f:
+                    f.write(encoded)
+
+    @cached_property
+    def fingerprinted_names(self):
+        return frozenset(self.hashed_files.values())
+
+    def url(self, name, force=False):
+        # Before the first collectstatic there is no manifest to look names up
+        # in; serve the plain names rather than failing every page.
+        if not self.hashed_files:
+            return StaticFilesStorage.url(self, name)
+        return super().url(name, force)
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = coding.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.lower())
+    return accepted
+
+
+def parse_range(header, size):
+    """Return the (start, end) of a single byte range, or None to send everything
+
+    Raises ValueError for a range that can't be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFile:
+    """File wrapper that stops reading after ``length`` bytes"""
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def serve_file(request, root, path, cache_control, precompressed=False):
+    try:
+        fullpath = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    encoding = None
+    if precompressed and 'Range' not in request.headers:
+        accepted = accepted_encodings(request)
+        for suffix, coding in [('br', 'br'), ('gz', 'gzip')]:
+            if coding in accepted and os.path.isfile(f'{fullpath}.{suffix}'):
+                fullpath, encoding = f'{fullpath}.{suffix}', coding
+                break
+
+    stat = os.stat(fullpath)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    last_modified = http_date(stat.st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is None:
+        range_header = request.headers.get('Range')
+        if request.headers.get('If-Range', etag) not in (etag, last_modified):
+            range_header = None
+        try:
+            byte_range = None if encoding else parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        f = open(fullpath, 'rb')
+        if byte_range is None:
+            response = FileResponse(f, content_type=content_type)
+        else:
+            start, end = byte_range
+            f.seek(start)
+            # Open-ended ranges keep the real file so sendfile() still applies
+            body = f if end == stat.st_size - 1 else RangeFile(f, end - start + 1)
+            response = FileResponse(body, content_type=content_type, status=206)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    else:
+        response = not_modified
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = cache_control
+    response['Accept-Ranges'] = 'bytes'
+    if precompressed:
+        response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+@require_safe
+def serve_static(request, path):
+    """Serve a collected static file, precompressed where possible"""
+    fingerprinted = path in getattr(staticfiles_storage, 'fingerprinted_names', ())
+    return serve_file(request, settings.STATIC_ROOT, path,
+                      IMMUTABLE if fingerprinted else REVALIDATE, precompressed=True)
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded file or one of its resized copies"""
+    content_hashed = path.startswith(f'{DERIVATIVES_DIR}/')
+    return serve_file(request, settings.MEDIA_ROOT, path,
+                      IMMUTABLE if content_hashed else REVALIDATE)
+
+
+def urlpatterns():
+    """URL patterns for STATIC_URL and MEDIA_URL when they are served by Django"""
+    patterns = []
+    for url, view in [(settings.STATIC_URL, serve_static), (settings.MEDIA_URL, serve_media)]:
+        if url and not urlsplit(url).netloc:
+            patterns.append(re_path(rf'^{re.escape(url.lstrip("/"))}(?P<path>.+)$', view))
+    return patterns
@@ -0,0 +1,161 @@
+"""In-memory typeahead index over product and category names.
+
+Every word of every active product and category name is stored as a key in
+one sorted list, so a prefix lookup is a ``bisect`` plus a short forward
+scan. Each worker builds its own copy at startup and rebuilds it when the
+``autocomplete`` version in the shared cache is bumped by the catalog
+signals. The rebuild runs in a background thread while queries keep being
+answered from the previous copy, so answering a query never touches the
+database.
+"""
+import bisect
+import logging
+import re
+import threading
+from array import array
+
+from django.db import DatabaseError, connection
+from django.urls import reverse
+
+from .caching import get_version
+from .models import Category, Product
+from .routers import primary
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_NAMESPACE = 'autocomplete'
+
+# Candidates examined per lookup before ranking; bounds the cost of very
+# short prefixes that match a large part of the catalog.
+MAX_CANDIDATES = 200
+
+KIND_CATEGORY = 'category'
+KIND_PRODUCT = 'product'
+
+
+def normalize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+class PrefixIndex:
+    """Sorted word keys pointing at (label, url, kind) entries"""
+
+    def __init__(self, entries):
+        self.entries = []
+        self.words = []
+        keyed = []
+        for label, url, kind in entries:
+            entry_id = len(self.entries)
+            words = normalize(label)
+            self.entries.append((label, url, kind))
+            self.words.append(tuple(words))
+            for position, word in enumerate(words):
+                keyed.append((word, position, entry_id))
+        keyed.sort()
+        self.keys = [word for word, _, _ in keyed]
+        self.positions = array('H', (min(position, 0xFFFF) for _, position, _ in keyed))
+        self.entry_ids = array('I', (entry_id for _, _, entry_id in keyed))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def suggest(self, query, limit=8):
+        terms = normalize(query)
+        if not terms:
+            return []
+        first, rest = terms[0], terms[1:]
+        seen = {}
+        i = bisect.bisect_left(self.keys, first)
+        while (i < len(self.keys) and self.keys[i].startswith(first)
+               and len(seen) < MAX_CANDIDATES):
+            entry_id = self.entry_ids[i]
+            if entry_id not in seen and self._matches_rest(entry_id, rest):
+                seen[entry_id] = self.positions[i]
+            i += 1
+        # Categories first, then names that start with the query, then by label.
+        ranked = sorted(seen, key=lambda entry_id: (
+            self.entries[entry_id][2] != KIND_CATEGORY,
+            seen[entry_id] != 0,
+            self.entries[entry_id][0].lower(),
+        ))
+        return [
+            {'label': label, 'url': url, 'kind': kind}
+            for label, url, kind in (self.entries[entry_id] for entry_id in ranked[:limit])
+        ]
+
+    def _matches_rest(self, entry_id, terms):
+        words = self.words[entry_id]
+        return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+def build_index():
+    entries = [
+        (name, reverse('shop:category_products', kwargs={'slug': slug}), KIND_CATEGORY)
+        for name, slug in Category.objects.filter(is_active=True).order_by().values_list('name', 'slug')
+    ]
+    entries.extend(
+        (name, reverse('shop:product_detail', kwargs={'slug': slug}), KIND_PRODUCT)
+        for name, slug in Product.objects.filter(
+            is_active=True, category__is_active=True,
+        ).order_by().values_list('name', 'slug').iterator()
+    )
+    return PrefixIndex(entries)
+
+
+_lock = threading.Lock()
+_state = {'version': None, 'index': PrefixIndex([]), 'rebuild': None}
+
+
+def _rebuild(version):
+    try:
+        with primary():
+            index = build_index()
+        with _lock:
+            _state.update(index=index, version=version)
+    except Exception:
+        logger.exception('Autocomplete index rebuild failed; serving the previous index')
+    finally:
+        with _lock:
+            _state['rebuild'] = None
+        connection.close()
+
+
+def get_index():
+    """Return this worker's index, refreshing it if the catalog changed
+
+    Only the first build makes callers wait. After that a version bump
+    starts one background rebuild and callers get the previous index until
+    it is done. Inside a transaction the rebuild happens in place instead,
+    as another connection would not see the transaction's own writes.
+    """
+    version = get_version(AUTOCOMPLETE_NAMESPACE)
+    if _state['version'] == version:
+        return _state['index']
+    if _state['version'] is None or connection.in_atomic_block:
+        with _lock:
+            if _state['version'] != version:
+                with primary():
+                    _state.update(index=build_index(), version=version)
+        return _state['index']
+    with _lock:
+        if _state['rebuild'] is None:
+            _state['rebuild'] = threading.Thread(
+                target=_rebuild, args=(version,), name='autocomplete-rebuild', daemon=True)
+            _state['rebuild'].start()
+    return _state['index']
+
+
+def suggest(query, limit=8):
+    return get_index().suggest(query, limit)
+
+
+def warm_index():
+    """Build the index ahead of the first request; called at worker start"""
+    try:
+        get_index()
+    except DatabaseError:
+        # Tables may not exist yet, e.g. before the first migrate.
+        logger.warning('Autocomplete index not built at startup', exc_info=True)
+    finally:
+        # Don't keep the startup thread's connection open for the worker's lifetime.
+        connection.close()
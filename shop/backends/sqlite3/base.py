@@ -0,0 +1,112 @@
+"""SQLite backend tuned for a multi-threaded production server.
+
+Stock SQLite settings let one checkout's write transaction make concurrent
+requests fail with ``database is locked``. This backend differs from
+Django's in three ways:
+
+* Each new connection switches the database to WAL journaling, so readers
+  never wait for the writer. It also applies the ``PRAGMAS`` below. They can
+  be overridden through ``OPTIONS['pragmas']``.
+* Transactions start with ``BEGIN IMMEDIATE`` rather than a deferred
+  ``BEGIN``. A deferred transaction that reads and then writes can't be
+  retried by SQLite's busy handler once another writer got in first, and
+  fails at once; an immediate one takes the write lock up front and simply
+  waits for it.
+* Within a process, transactions on the same database file queue on a lock
+  before they begin, instead of all polling SQLite's busy handler. Waiting
+  is bounded by the ``timeout`` option, after which the transaction fails as
+  SQLite would. Set ``OPTIONS['serialize_writes']`` to False to turn this
+  off. Separate processes still coordinate through SQLite's own locking.
+
+Every transaction is treated as a writer: SQLite can't tell in advance
+whether one will write, and taking the lock only at the first write would
+bring back the failures ``BEGIN IMMEDIATE`` avoids. So a read-only
+``atomic()`` block (including ``ATOMIC_REQUESTS``) waits in the queue
+behind writers and holds up the ones after it. Reads outside transactions
+never queue. Code that reads and then writes in one transaction, like
+``place_order`` or ``merge_anonymous_cart``, needs the lock anyway; keep
+read-only work out of those blocks, and keep them short.
+"""
+import threading
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+DEFAULT_TIMEOUT = 20
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # WAL stays consistent across crashes at NORMAL; only the last commits
+    # before a power loss can be lost, and each commit skips an fsync.
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # KiB, per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def write_lock(name):
+    """The process-wide lock serializing transactions on database ``name``"""
+    with _write_locks_guard:
+        return _write_locks.setdefault(str(name), threading.Lock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = {**PRAGMAS, **options.get('pragmas', {})}
+        self.serialize_writes = options.get('serialize_writes', True)
+        self.timeout = options.get('timeout', DEFAULT_TIMEOUT)
+        self.holds_write_lock = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('serialize_writes', None)
+        # sqlite3's own timeout is its busy handler: how long a statement waits
+        # for another connection's lock before giving up.
+        params['timeout'] = self.timeout
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.serialize_writes:
+            if not write_lock(self.settings_dict['NAME']).acquire(timeout=self.timeout):
+                raise OperationalError('database is locked: timed out waiting for the write queue')
+            self.holds_write_lock = True
+        try:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self.release_write_lock()
+            raise
+
+    def release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            write_lock(self.settings_dict['NAME']).release()
+
+    def _commit(self):
+        # On failure the lock is kept for the rollback that follows
+        super()._commit()
+        self.release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release_write_lock()
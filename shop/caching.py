@@ -0,0 +1,54 @@
+"""Version counters kept in the shared cache.
+
+Each worker process keeps its own copy of data that rarely changes (the
+category navigation, for example) and tags it with the namespace version it
+was built from. Writers bump the version in the shared cache, so every worker
+notices on its next read with one cache lookup and no database query.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+
+def version_key(namespace):
+    return f'shop:version:{namespace}'
+
+
+def modified_key(namespace):
+    return f'shop:modified:{namespace}'
+
+
+def _initial_version():
+    # Seed from the clock so a counter that was evicted from the cache never
+    # comes back at a value some worker already holds a copy for.
+    return time.time_ns() // 1000
+
+
+def get_version(namespace):
+    """Return the current version number of ``namespace``"""
+    key = version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate every copy built from ``namespace``"""
+    key = version_key(namespace)
+    cache.set(modified_key(namespace), time.time(), None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+        return cache.get(key)
+
+
+def get_last_modified(namespace):
+    """Return when ``namespace`` was last bumped, or None if unknown"""
+    timestamp = cache.get(modified_key(namespace))
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
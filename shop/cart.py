@@ -0,0 +1,222 @@
+"""Denormalized cart badge count kept in the cache backend, and anonymous carts
+
+Logged-out visitors keep their cart in a signed cookie instead of ``Cart``
+rows, so browsing and filling a cart writes nothing to the database. At
+login ``merge_anonymous_cart`` moves the cookie's lines into the user's
+``Cart`` with one bulk upsert.
+"""
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Sum
+
+from .models import Cart, CartItem, CartSummary, Product
+
+logger = logging.getLogger(__name__)
+
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+
+CART_COOKIE = 'cart'
+CART_COOKIE_SALT = 'shop.cart'
+# Keeps the signed cookie far below the 4 KB browsers accept
+ANONYMOUS_CART_MAX_LINES = 50
+
+
+def cart_count_key(user_id):
+    return f'shop:cart_count:{user_id}'
+
+
+def get_cart_count(user):
+    """Return the number of items in the user's cart, from cache when warm"""
+    if not user.is_authenticated:
+        return 0
+    count = cache.get(cart_count_key(user.pk))
+    if count is None:
+        count = refresh_cart_count(user)
+    return count
+
+
+def refresh_cart_count(user):
+    """Recount the user's cart items and write the result through to the cache"""
+    count = CartItem.objects.filter(cart__user=user).aggregate(
+        count=Sum('quantity'))['count'] or 0
+    set_cart_count(user, count)
+    return count
+
+
+def set_cart_count(user, count):
+    cache.set(cart_count_key(user.pk), count, CART_COUNT_TIMEOUT)
+
+
+def get_request_cart_count(request):
+    """The cart badge count for whoever made the request"""
+    if request.user.is_authenticated:
+        return get_cart_count(request.user)
+    return get_anonymous_cart(request).count
+
+
+class AnonymousCartLine:
+    """Stands in for a CartItem in templates; ``id`` is the product's"""
+
+    def __init__(self, product, quantity):
+        self.id = product.pk
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def total_price(self):
+        return self.product.price * self.quantity
+
+
+class AnonymousCart:
+    """A logged-out visitor's cart: product ids and quantities, in order added
+
+    Stored as ``"<product_id>-<quantity>"`` pairs joined by dots.
+    ``AnonymousCartMiddleware`` writes the cookie back when it changes.
+    """
+
+    def __init__(self, value=''):
+        self.lines = {}
+        self.changed = False
+        try:
+            for line in filter(None, value.split('.')):
+                product_id, quantity = map(int, line.split('-'))
+                if quantity > 0 and len(self.lines) < ANONYMOUS_CART_MAX_LINES:
+                    self.lines[product_id] = quantity
+        except ValueError:
+            self.lines = {}
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def __contains__(self, product_id):
+        return product_id in self.lines
+
+    @property
+    def count(self):
+        return sum(self.lines.values())
+
+    def add(self, product_id, quantity, stock):
+        """Add to a product's quantity, up to ``stock``; False if the cart has no room for a new line"""
+        if product_id not in self.lines and len(self.lines) >= ANONYMOUS_CART_MAX_LINES:
+            return False
+        self.lines[product_id] = min(self.lines.get(product_id, 0) + quantity, stock)
+        self.changed = True
+        return True
+
+    def update(self, product_id, quantity):
+        self.lines[product_id] = quantity
+        self.changed = True
+
+    def remove(self, product_id):
+        self.lines.pop(product_id, None)
+        self.changed = True
+
+    def clear(self):
+        self.lines = {}
+        self.changed = True
+
+    def items(self):
+        """Lines with their products, skipping products deleted since"""
+        products = Product.objects.select_related('category').in_bulk(list(self.lines))
+        return [AnonymousCartLine(products[product_id], quantity)
+                for product_id, quantity in self.lines.items() if product_id in products]
+
+    @staticmethod
+    def summary(items):
+        return CartSummary.from_totals(sum(item.quantity for item in items),
+                                       sum(item.total_price for item in items))
+
+    def save(self, response):
+        if not self.changed:
+            return
+        if self.lines:
+            value = '.'.join(f'{product_id}-{quantity}' for product_id, quantity in self.lines.items())
+            response.set_signed_cookie(CART_COOKIE, value, salt=CART_COOKIE_SALT,
+                                       max_age=settings.ANONYMOUS_CART_COOKIE_AGE,
+                                       httponly=True, samesite='Lax')
+        else:
+            response.delete_cookie(CART_COOKIE, samesite='Lax')
+
+
+def get_anonymous_cart(request):
+    """The request's cookie cart, read once per request"""
+    if not hasattr(request, 'anonymous_cart'):
+        request.anonymous_cart = AnonymousCart(request.get_signed_cookie(
+            CART_COOKIE, default='', salt=CART_COOKIE_SALT, max_age=settings.ANONYMOUS_CART_COOKIE_AGE))
+    return request.anonymous_cart
+
+
+def merge_anonymous_cart(request, user):
+    """Move the request's cookie cart into ``user``'s Cart
+
+    Quantities are added to any already in the cart, capped at the stock
+    available, and written with a single INSERT ... ON CONFLICT DO UPDATE.
+    Returns the names of products left out because they are out of stock.
+    """
+    anonymous = get_anonymous_cart(request)
+    if not anonymous:
+        return []
+    with transaction.atomic():
+        products = Product.objects.filter(pk__in=list(anonymous.lines)).order_by()
+        stock = {pk: (name, quantity) for pk, name, quantity in
+                 products.values_list('pk', 'name', 'stock_quantity')}
+        in_stock = [pk for pk, (name, quantity) in stock.items() if quantity > 0]
+        cart, created = Cart.objects.get_or_create(user=user)
+        existing = {} if created else dict(
+            cart.items.filter(product__in=in_stock).values_list('product_id', 'quantity'))
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=product_id,
+                      quantity=min(existing.get(product_id, 0) + quantity, stock[product_id][1]))
+             for product_id, quantity in anonymous.lines.items() if product_id in in_stock],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'],
+        )
+    anonymous.clear()
+    refresh_cart_count(user)
+    # Products deleted since they were added are dropped without a mention
+    return [name for name, quantity in stock.values() if quantity <= 0]
+
+
+def claim_anonymous_cart(request, user):
+    """Merge the cookie cart into ``user``'s, telling them what was left out
+
+    A failed merge is logged and leaves the cookie in place, so it is tried
+    again on the user's next visit to the cart.
+    """
+    try:
+        unavailable = merge_anonymous_cart(request, user)
+    except DatabaseError:
+        logger.exception('Could not merge the cookie cart of user %s', user.pk)
+        messages.warning(request, "We couldn't add the items from your cart yet; we'll try again shortly.")
+        return
+    if unavailable:
+        messages.warning(request, f'Out of stock and removed from your cart: {", ".join(unavailable)}.')
+
+
+class AnonymousCartMiddleware:
+    """Write changed cookie carts to the response"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.save_cart(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.save_cart(request, await self.get_response(request))
+
+    def save_cart(self, request, response):
+        if hasattr(request, 'anonymous_cart'):
+            request.anonymous_cart.save(response)
+        return response
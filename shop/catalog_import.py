@@ -0,0 +1,286 @@
+"""Bulk product import from CSV or JSON Lines supplier feeds.
+
+Rows are read lazily and handled in fixed-size chunks: each chunk is
+validated and written inside its own transaction, together with the
+matching search index rows. Rows with a slug are keyed by it and written
+with one ``INSERT ... ON CONFLICT (slug) DO UPDATE``. Rows without one are
+always new products: each gets its slugified name, suffixed ``-2``, ``-3``
+and so on past slugs already taken, so products that share a name are
+never merged and a feed can't overwrite a product it doesn't name.
+Categories are resolved from a dict loaded once, so a chunk costs a handful
+of queries however many rows it holds, and memory stays flat regardless of
+the feed's size.
+
+Columns: ``name``, ``category`` (name or slug), ``price`` and optionally
+``slug``, ``description``, ``stock`` (or ``stock_quantity``), ``is_active``
+and ``image`` (a path under MEDIA_ROOT). Feeds that are re-imported to
+update their products must carry slugs.
+"""
+import csv
+import hashlib
+import io
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import search
+from .autocomplete import AUTOCOMPLETE_NAMESPACE
+from .caching import bump_version
+from .categories import refresh_product_counts
+from .conditional import invalidate_catalog
+from .models import Category, Product
+from .rankings import invalidate_rankings
+
+CHUNK_SIZE = 2000
+
+UPDATE_FIELDS = ['category', 'name', 'description', 'price', 'stock_quantity', 'is_active', 'updated_at']
+
+SLUG_LENGTH = Product._meta.get_field('slug').max_length
+NAME_LENGTH = Product._meta.get_field('name').max_length
+PRICE_FIELD = Product._meta.get_field('price')
+
+# Room kept at the end of a generated slug for a "-<n>" suffix
+SUFFIX_LENGTH = 8
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt=None):
+    """Yield (line number, row dict) from a CSV or JSONL file, or stdin for '-'"""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    if path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    else:
+        stream = open(path, encoding='utf-8-sig', newline='')
+    with stream:
+        if fmt == 'jsonl':
+            for line_number, line in enumerate(stream, start=1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        row = e
+                    yield line_number, row
+        else:
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def make_slug(name):
+    slug = slugify(name)[:SLUG_LENGTH].strip('-')
+    # Names with no sluggable characters still need a stable, unique key
+    return slug or 'product-' + hashlib.sha1(name.encode()).hexdigest()[:12]
+
+
+def with_suffix(slug, number):
+    if number == 1:
+        return slug
+    suffix = f'-{number}'
+    return slug[:SLUG_LENGTH - len(suffix)].rstrip('-') + suffix
+
+
+def allocate_slugs(products, reserved=()):
+    """Give each product a slug unused by any product or in ``reserved``
+
+    ``product.slug`` holds the wanted slug on entry. Taken slugs are looked
+    up in one query, plus one per wanted slug that turns out to be taken.
+    """
+    taken = set(reserved)
+    taken.update(Product.objects.filter(slug__in={product.slug for product in products})
+                 .values_list('slug', flat=True))
+    loaded = set()
+    for product in products:
+        wanted, number = product.slug, 1
+        while with_suffix(wanted, number) in taken:
+            if wanted not in loaded:
+                loaded.add(wanted)
+                taken.update(Product.objects.filter(slug__startswith=wanted[:SLUG_LENGTH - SUFFIX_LENGTH])
+                             .values_list('slug', flat=True))
+            number += 1
+        product.slug = with_suffix(wanted, number)
+        taken.add(product.slug)
+
+
+def parse_price(value):
+    try:
+        price = Decimal(str(value).strip().replace(',', ''))
+    except InvalidOperation:
+        raise RowError(f'invalid price {value!r}')
+    if not price.is_finite() or price < 0:
+        raise RowError(f'invalid price {value!r}')
+    price = price.quantize(Decimal('0.01'))
+    if len(price.as_tuple().digits) > PRICE_FIELD.max_digits:
+        raise RowError(f'price {value!r} is too large')
+    return price
+
+
+def parse_stock(value):
+    if value in (None, ''):
+        return 0
+    try:
+        stock = int(str(value).strip())
+    except ValueError:
+        raise RowError(f'invalid stock {value!r}')
+    if stock < 0:
+        raise RowError(f'invalid stock {value!r}')
+    return stock
+
+
+def parse_bool(value):
+    if value in (None, ''):
+        return True
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'invalid is_active {value!r}')
+
+
+class CatalogImporter:
+    """Upserts products from parsed feed rows, one chunk per transaction"""
+
+    def __init__(self, chunk_size=CHUNK_SIZE, create_categories=False, dry_run=False, max_errors=20):
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.create_categories = create_categories
+        self.dry_run = dry_run
+        self.categories = {}
+        for category in Category.objects.only('pk', 'name', 'slug'):
+            self.categories[category.name.lower()] = category.pk
+            self.categories[category.slug] = category.pk
+        self.touched_categories = set()
+        self.rows = self.imported = self.created = self.duplicates = self.invalid = 0
+        # Only the first ``max_errors`` are kept, so a bad feed can't exhaust memory
+        self.errors = []
+        self.images = False
+
+    def resolve_categories(self, names):
+        missing = {name for name in names if name and name.lower() not in self.categories}
+        if missing and self.create_categories and self.dry_run:
+            self.categories.update(dict.fromkeys((name.lower() for name in missing), 0))
+        elif missing and self.create_categories:
+            Category.objects.bulk_create(
+                [Category(name=name, slug=slugify(name)) for name in sorted(missing)],
+                ignore_conflicts=True)
+            for category in Category.objects.filter(name__in=missing).only('pk', 'name', 'slug'):
+                self.categories[category.name.lower()] = category.pk
+                self.categories[category.slug] = category.pk
+
+    def category_id(self, name):
+        category_id = self.categories.get(name.lower())
+        if category_id is None:
+            raise RowError(f'unknown category {name!r}')
+        return category_id
+
+    def build(self, row):
+        if isinstance(row, Exception):
+            raise RowError(f'invalid JSON: {row}')
+        if not isinstance(row, dict):
+            raise RowError('row is not an object')
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise RowError('missing name')
+        if len(name) > NAME_LENGTH:
+            raise RowError(f'name longer than {NAME_LENGTH} characters')
+        slug = str(row.get('slug') or '').strip()
+        if slug and (len(slug) > SLUG_LENGTH or slugify(slug) != slug):
+            raise RowError(f'invalid slug {slug!r}')
+        stock = row.get('stock', row.get('stock_quantity'))
+        product = Product(
+            # Rows without a slug get a unique one when they are written
+            slug=slug or make_slug(name),
+            name=name,
+            category_id=self.category_id(str(row.get('category') or '').strip()),
+            description=str(row.get('description') or ''),
+            price=parse_price(row.get('price', '')),
+            stock_quantity=parse_stock(stock),
+            is_active=parse_bool(row.get('is_active')),
+        )
+        product.keyed = bool(slug)
+        if 'image' in row:
+            # Once a feed has an image column it is authoritative, blanks included
+            product.image = str(row['image'] or '') or None
+            self.images = True
+        return product
+
+    def import_chunk(self, chunk):
+        self.resolve_categories({
+            str(row.get('category') or '').strip() for _, row in chunk if isinstance(row, dict)
+        })
+        keyed, new = {}, []
+        for line_number, row in chunk:
+            self.rows += 1
+            try:
+                product = self.build(row)
+            except RowError as e:
+                self.invalid += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append((line_number, str(e)))
+                continue
+            if not product.keyed:
+                new.append(product)
+                continue
+            if product.slug in keyed:
+                self.duplicates += 1
+            # The last row for a slug wins, as if the rows were applied in order
+            keyed[product.slug] = product
+        if not (keyed or new) or self.dry_run:
+            return
+        update_fields = UPDATE_FIELDS + (['image', 'image_digest'] if self.images else [])
+        with transaction.atomic():
+            existing = dict(Product.objects.filter(slug__in=list(keyed)).values_list('slug', 'category_id'))
+            if keyed:
+                Product.objects.bulk_create(
+                    keyed.values(),
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=update_fields,
+                )
+            if new:
+                allocate_slugs(new, reserved=keyed)
+                Product.objects.bulk_create(new)
+            products = [*keyed.values(), *new]
+            search.rebuild_index(Product.objects.filter(slug__in=[product.slug for product in products])
+                                 .values_list('pk', flat=True))
+        self.touched_categories.update(existing.values())
+        self.touched_categories.update(product.category_id for product in products)
+        self.imported += len(products)
+        self.created += len(products) - len(existing)
+
+    def run(self, rows, progress=None):
+        """Import every row; ``progress`` is called after each chunk"""
+        started = time.perf_counter()
+        for chunk in chunked(rows, self.chunk_size):
+            self.import_chunk(chunk)
+            if progress:
+                progress(self, time.perf_counter() - started)
+        if self.imported:
+            self.finish()
+        return self
+
+    def finish(self):
+        # bulk_create sends no signals, so refresh what the Product receivers maintain
+        refresh_product_counts(self.touched_categories)
+        bump_version(AUTOCOMPLETE_NAMESPACE)
+        invalidate_rankings()
+        invalidate_catalog()
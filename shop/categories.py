@@ -0,0 +1,51 @@
+"""Active-category list shared by every page's navigation"""
+import threading
+
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .caching import bump_version, get_version
+from .models import Category, Product
+from .routers import primary
+
+CATEGORY_NAMESPACE = 'categories'
+
+_lock = threading.Lock()
+_state = {'version': None, 'categories': [], 'by_slug': {}}
+
+
+def _load():
+    version = get_version(CATEGORY_NAMESPACE)
+    if _state['version'] != version:
+        with _lock:
+            if _state['version'] != version:
+                with primary():
+                    categories = list(Category.objects.filter(is_active=True))
+                _state.update(
+                    categories=categories,
+                    by_slug={category.slug: category for category in categories},
+                    version=version,
+                )
+    return _state
+
+
+def get_active_categories():
+    """Return the active categories in display order"""
+    return _load()['categories']
+
+
+def get_active_category(slug):
+    """Return the active category with ``slug``, or None"""
+    return _load()['by_slug'].get(slug)
+
+
+def refresh_product_counts(category_ids):
+    """Recount ``active_product_count`` for the given categories in one UPDATE"""
+    category_ids = {pk for pk in category_ids if pk is not None}
+    if not category_ids:
+        return
+    active = (Product.objects.filter(category=OuterRef('pk'), is_active=True).order_by()
+              .values('category').annotate(count=Count('*')).values('count'))
+    Category.objects.filter(pk__in=category_ids).update(
+        active_product_count=Coalesce(Subquery(active), 0))
+    bump_version(CATEGORY_NAMESPACE)
@@ -0,0 +1,55 @@
+"""Conditional GET support for catalog pages.
+
+Validators come from the ``catalog`` version in the shared cache, which is
+bumped whenever products, categories or stock change, so answering a
+revalidation costs a couple of cache reads instead of rendering the page.
+The ETag also covers the per-user parts of the layout (who is logged in,
+the cart badge, the CSRF cookie) and is skipped while flash messages are
+waiting to be shown. Last-Modified is only sent to cookie-less clients such
+as crawlers, whose pages carry no personal state.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+
+from .cart import get_request_cart_count
+from .caching import bump_version, get_last_modified, get_version
+
+CATALOG_NAMESPACE = 'catalog'
+
+
+def invalidate_catalog():
+    """Make every cached catalog page revalidate in full"""
+    bump_version(CATALOG_NAMESPACE)
+
+
+def catalog_etag(request, *args, **kwargs):
+    if len(get_messages(request)):
+        return None
+    parts = [
+        get_version(CATALOG_NAMESPACE),
+        request.user.pk or 'anonymous',
+        get_request_cart_count(request),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    return hashlib.md5('|'.join(map(str, parts)).encode(), usedforsecurity=False).hexdigest()
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    if request.COOKIES:
+        return None
+    return get_last_modified(CATALOG_NAMESPACE)
+
+
+def conditional_catalog_page(view):
+    """Answer repeat requests for a catalog page with 304 Not Modified"""
+    view = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)(view)
+    return cache_control(no_cache=True)(vary_on_cookie(view))
+
+
+conditional_catalog_view = method_decorator(conditional_catalog_page, name='get')
@@ -1,16 +1,13 @@
-"""Context processor for cart count"""
-from .models import Cart
+"""Context processors for the cart count and category navigation"""
+from .cart import get_request_cart_count
+from .categories import get_active_categories
 
 
 def cart_count(request):
     """Add cart item count to all templates"""
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            count = cart.total_items
-        except Cart.DoesNotExist:
-            count = 0
-    else:
-        count = 0
-    
-    return {'cart_count': count}
+    return {'cart_count': get_request_cart_count(request)}
+
+
+def categories(request):
+    """Add the active categories for navigation to all templates"""
+    return {'categories': get_active_categories()}
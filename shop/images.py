@@ -0,0 +1,180 @@
+"""Resized WebP and JPEG copies of product and category images.
+
+Every uploaded image is rendered once at each width in ``WIDTHS`` into
+``MEDIA_ROOT/derivatives``, under a name derived from the source file's
+content hash. The hash is stored on the model as ``image_digest``, so the
+``responsive_image`` template tag can build ``srcset`` URLs without touching
+the disk, and identical uploads share one set of files. Saving a product or
+category renders its copies in a background thread once the transaction
+commits, then sends ``digest_changed`` so cached pages pick up the new
+digest; ``build_image_derivatives`` renders the whole catalog in a process
+pool.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection, transaction
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# Sent with the model class as sender after a stored image digest changes
+digest_changed = Signal()
+
+# One thread, so renders run in the order they were scheduled
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-derivatives')
+
+DERIVATIVES_DIR = 'derivatives'
+
+WIDTHS = (80, 160, 300, 400, 500, 600, 800, 1000)
+
+# File extension -> Pillow format and save options
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Preset -> (widths offered in srcset, sizes attribute)
+PRESETS = {
+    'thumb': ((80, 160), '80px'),
+    'card': ((300, 600), '(min-width: 992px) 25vw, (min-width: 576px) 50vw, 100vw'),
+    'category': ((400, 800), '(min-width: 768px) 33vw, 100vw'),
+    'detail': ((500, 1000), '(min-width: 768px) 50vw, 100vw'),
+}
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            sha.update(block)
+    return sha.hexdigest()[:32]
+
+
+def derivative_name(digest, width, ext):
+    return f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}-{width}.{ext}'
+
+
+def derivative_url(digest, width, ext):
+    return default_storage.url(derivative_name(digest, width, ext))
+
+
+def _flatten(image):
+    # JPEG has no alpha channel; composite transparent images onto white.
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_derivatives(source_path, media_root, widths=WIDTHS):
+    """Write any missing resized copies of ``source_path`` and return its digest
+
+    Only needs a file path and Pillow, so it can run in a worker process
+    without Django being set up. Images are never enlarged.
+    """
+    digest = file_digest(source_path)
+    missing = [
+        (width, ext) for width in widths for ext in FORMATS
+        if not os.path.exists(os.path.join(media_root, derivative_name(digest, width, ext)))
+    ]
+    if not missing:
+        return digest
+    with Image.open(source_path) as source:
+        source = ImageOps.exif_transpose(source)
+        source.load()
+    resized = {}
+    for width, ext in missing:
+        if width not in resized:
+            image = source.copy()
+            image.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+            resized[width] = image
+        image = resized[width]
+        pillow_format, options = FORMATS[ext]
+        if pillow_format == 'JPEG':
+            image = _flatten(image)
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        path = os.path.join(media_root, derivative_name(digest, width, ext))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        partial = f'{path}.{os.getpid()}.tmp'
+        image.save(partial, pillow_format, **options)
+        os.replace(partial, path)
+    return digest
+
+
+def _render_job(job):
+    label, pk, path, media_root = job
+    try:
+        return label, pk, render_derivatives(path, media_root), None
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return label, pk, None, f'{path}: {e}'
+
+
+def _render_and_store(model, pk, name, path, media_root):
+    digest = ''
+    try:
+        digest = render_derivatives(path, media_root)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Could not resize %s', name, exc_info=True)
+    try:
+        # A row whose image was replaced meanwhile is left to that image's render
+        if model.objects.filter(pk=pk, image=name).exclude(image_digest=digest).update(image_digest=digest):
+            digest_changed.send(sender=model, pk=pk)
+    except DatabaseError:
+        logger.exception('Could not store the image digest of %s %s', model._meta.label, pk)
+    finally:
+        connection.close()
+
+
+def update_image_digest(instance):
+    """Render ``instance``'s image copies in the background once the transaction commits
+
+    An image that was removed just has its digest cleared.
+    """
+    if not instance.image:
+        if instance.image_digest:
+            type(instance).objects.filter(pk=instance.pk).update(image_digest='')
+            instance.image_digest = ''
+        return
+    job = (type(instance), instance.pk, instance.image.name, instance.image.path, str(settings.MEDIA_ROOT))
+    transaction.on_commit(lambda: _executor.submit(_render_and_store, *job))
+
+
+def backfill_derivatives(querysets, workers=None, force=False, progress=None):
+    """Render copies for every image in ``querysets`` using a process pool
+
+    Rows that already have a digest are skipped unless ``force``. Returns
+    ``(rendered, failed)``; ``progress`` is called with each failure message.
+    """
+    models = {}
+    jobs = []
+    for queryset in querysets:
+        models[queryset.model._meta.label] = queryset.model
+        queryset = queryset.exclude(image='').exclude(image=None)
+        if not force:
+            queryset = queryset.filter(image_digest='')
+        for pk, name in queryset.values_list('pk', 'image').iterator():
+            jobs.append((queryset.model._meta.label, pk, default_storage.path(name), str(settings.MEDIA_ROOT)))
+    updates = {label: [] for label in models}
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for label, pk, digest, error in pool.map(_render_job, jobs, chunksize=4):
+            if error:
+                failed += 1
+                if progress:
+                    progress(error)
+                continue
+            updates[label].append(models[label](pk=pk, image_digest=digest))
+    for label, rows in updates.items():
+        models[label].objects.bulk_update(rows, ['image_digest'], batch_size=500)
+    return sum(map(len, updates.values())), failed
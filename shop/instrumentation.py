@@ -0,0 +1,207 @@
+"""Per-request query and template timing, and per-view query budgets.
+
+``RequestTimingMiddleware`` counts every SQL statement a request runs, sums
+their time, keeps the slowest few, and adds up template rendering time
+(through ``TimedDjangoTemplates``). Each request is logged to the
+``shop.requests`` logger with those figures as structured ``extra`` fields,
+and with ``SERVER_TIMING`` on they are also sent as a ``Server-Timing``
+header for the browser's network panel.
+
+Views declare how many queries they may run with ``@query_budget``. A
+request over budget is logged as a warning, and the test suite drives every
+view and fails on any that exceed theirs, so an N+1 shows up in CI rather
+than in production.
+"""
+import contextvars
+import heapq
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('shop.requests')
+
+# Statements kept per request for the log
+SLOWEST_QUERIES = 3
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+def query_budget(limit, **methods):
+    """Declare the most queries a view may run, e.g. ``@query_budget(4, post=9)``
+
+    The budget covers the whole request, sessions and authentication
+    included. Works on function views and view classes.
+    """
+    def decorator(view):
+        view.query_budget = {'default': limit, **{method.upper(): n for method, n in methods.items()}}
+        return view
+    return decorator
+
+
+def get_query_budget(view, method):
+    """The budget ``view`` declared for ``method``, or None"""
+    budget = getattr(view, 'query_budget', None) or getattr(getattr(view, 'view_class', None), 'query_budget', None)
+    if budget is None:
+        return None
+    return budget.get(method, budget['default'])
+
+
+class RequestTiming:
+    """What one request spent in the database and in templates"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []  # min-heap of (seconds, sql)
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.view = None
+        self.budget = None
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if len(self.slowest) < SLOWEST_QUERIES:
+                heapq.heappush(self.slowest, (elapsed, sql))
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (elapsed, sql))
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.queries > self.budget
+
+    def slowest_queries(self):
+        return [(sql, round(elapsed * 1000, 2)) for elapsed, sql in sorted(self.slowest, reverse=True)]
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'view': self.view,
+            'duration_ms': round(self.duration * 1000, 2),
+            'queries': self.queries,
+            'query_budget': self.budget,
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'slowest_queries': self.slowest_queries(),
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper that records into the current request's timing, if any"""
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing.record_query(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Connections belong to threads, and under ASGI a request's queries run
+    # in a thread other than its middleware's; so every connection gets the
+    # wrapper, and it finds its request through the context.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class RequestTimingMiddleware:
+    """Record queries and template time per request; keep this first in MIDDLEWARE"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        # Sync views and helpers run in a copy of this context, so their
+        # queries are still recorded against this request
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing)
+
+    def finish(self, request, response, timing):
+        timing.duration = time.perf_counter() - timing.started
+        # Read from the resolver rather than in process_view, which Django
+        # would have to run in a thread under ASGI
+        match = request.resolver_match
+        if match:
+            timing.view = match.view_name
+            timing.budget = get_query_budget(match.func, request.method)
+
+        response.request_timing = timing
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timing.server_timing()
+        fields = timing.as_dict()
+        fields.update(method=request.method, path=request.path, status=response.status_code)
+        if timing.over_budget:
+            logger.warning('%s %s ran %d queries, over its budget of %d', request.method, request.path,
+                           timing.queries, timing.budget, extra={'request_timing': fields})
+        else:
+            logger.info('%s %s %d %.1fms (%d queries, db %.1fms, templates %.1fms)', request.method, request.path,
+                        response.status_code, fields['duration_ms'], timing.queries, fields['db_ms'],
+                        fields['template_ms'], extra={'request_timing': fields})
+        return response
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None:
+            return super().render(context, request)
+        # Templates rendered from inside another (inclusion tags) are already counted
+        timing.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_depth -= 1
+            if not timing.template_depth:
+                timing.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The standard template backend, timing each render for RequestTimingMiddleware
+
+    Template time includes any queries run lazily while rendering.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
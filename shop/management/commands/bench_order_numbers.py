@@ -0,0 +1,59 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from shop.order_numbers import BLOCK_SIZE, OrderNumberAllocator
+
+
+def _allocate(count, block_size, start_event, queue):
+    allocator = OrderNumberAllocator(block_size)
+    start_event.wait()
+    started = time.perf_counter()
+    numbers = [allocator.allocate() for _ in range(count)]
+    queue.put((time.perf_counter() - started, numbers))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order number allocation across several processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--count', type=int, default=10000,
+                            help='Numbers allocated by each process (default: 10000)')
+        parser.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+
+    def handle(self, *args, **options):
+        processes, count = options['processes'], options['count']
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('This benchmark needs the fork start method.')
+        ctx = multiprocessing.get_context('fork')
+        # Children open their own connections; none may be inherited.
+        connections.close_all()
+
+        start_event = ctx.Event()
+        queue = ctx.Queue()
+        workers = [
+            ctx.Process(target=_allocate, args=(count, options['block_size'], start_event, queue))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        started = time.perf_counter()
+        start_event.set()
+        results = [queue.get() for _ in workers]
+        wall = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+
+        allocated = [number for _, numbers in results for number in numbers]
+        duplicates = len(allocated) - len(set(allocated))
+        self.stdout.write(
+            f'{len(allocated)} numbers from {processes} processes in {wall:.2f}s: '
+            f'{len(allocated) / wall:,.0f} allocations/s overall, '
+            f'{count / max(elapsed for elapsed, _ in results):,.0f}/s per process'
+        )
+        if duplicates:
+            raise CommandError(f'{duplicates} duplicate order numbers allocated')
+        self.stdout.write(self.style.SUCCESS('All order numbers unique'))
@@ -0,0 +1,146 @@
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+# Database settings for each mode; NAME is filled in per run
+MODES = {
+    'stock': {'ENGINE': 'django.db.backends.sqlite3'},
+    'tuned': {'ENGINE': 'shop.backends.sqlite3', 'OPTIONS': {'timeout': 20}},
+    # Tuned, but concurrent writers wait in SQLite's busy handler instead of the write queue
+    'unqueued': {'ENGINE': 'shop.backends.sqlite3', 'OPTIONS': {'timeout': 20, 'serialize_writes': False}},
+}
+
+READ_SPAN = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark SQLite read and write throughput from concurrent threads, '
+        "comparing Django's stock backend with shop.backends.sqlite3"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5.0,
+                            help='Seconds to run each mode (default: 5)')
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help='Fraction of operations that are write transactions (default: 0.2)')
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in options['modes']:
+                alias = f'bench_{mode}'
+                databases = connections.configure_settings({
+                    DEFAULT_DB_ALIAS: {},
+                    alias: {**MODES[mode], 'NAME': os.path.join(directory, f'{mode}.sqlite3')},
+                })
+                connections.settings[alias] = databases[alias]
+                try:
+                    self.setup(alias, options['rows'])
+                    result = self.run(alias, options)
+                finally:
+                    connections[alias].close()
+                    del connections[alias]
+                    del connections.settings[alias]
+                self.report(mode, options, result)
+
+    def setup(self, alias, rows):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('CREATE TABLE stock (id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL, '
+                           'name TEXT NOT NULL)')
+            cursor.execute('CREATE TABLE movement (id INTEGER PRIMARY KEY, stock_id INTEGER NOT NULL, '
+                           'delta INTEGER NOT NULL, created REAL NOT NULL)')
+            cursor.executemany('INSERT INTO stock (id, quantity, name) VALUES (%s, %s, %s)',
+                               [(i, 1000, f'Product {i}') for i in range(1, rows + 1)])
+
+    def run(self, alias, options):
+        rows = options['rows']
+        barrier = threading.Barrier(options['threads'] + 1)
+        lock = threading.Lock()
+        totals = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0, 'write_latencies': []}
+
+        def read(cursor, rng):
+            start = rng.randint(1, max(1, rows - READ_SPAN))
+            cursor.execute('SELECT id, quantity, name FROM stock WHERE id BETWEEN %s AND %s',
+                           [start, start + READ_SPAN])
+            cursor.fetchall()
+
+        def write(rng):
+            # Read then write in one transaction, like reserving stock at checkout
+            stock_id = rng.randint(1, rows)
+            with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                cursor.execute('SELECT quantity FROM stock WHERE id = %s', [stock_id])
+                quantity = cursor.fetchone()[0]
+                cursor.execute('UPDATE stock SET quantity = %s WHERE id = %s', [quantity - 1, stock_id])
+                cursor.execute('INSERT INTO movement (stock_id, delta, created) VALUES (%s, %s, %s)',
+                               [stock_id, -1, time.time()])
+
+        def work(seed):
+            rng = random.Random(seed)
+            counts = dict.fromkeys(['reads', 'writes', 'read_errors', 'write_errors'], 0)
+            latencies = []
+            try:
+                connections[alias].ensure_connection()
+                barrier.wait()
+                deadline = time.perf_counter() + options['duration']
+                while time.perf_counter() < deadline:
+                    if rng.random() < options['write_ratio']:
+                        started = time.perf_counter()
+                        try:
+                            write(rng)
+                        except OperationalError:
+                            counts['write_errors'] += 1
+                        else:
+                            counts['writes'] += 1
+                            latencies.append(time.perf_counter() - started)
+                    else:
+                        try:
+                            with connections[alias].cursor() as cursor:
+                                read(cursor, rng)
+                        except OperationalError:
+                            counts['read_errors'] += 1
+                        else:
+                            counts['reads'] += 1
+            finally:
+                connections[alias].close()
+            with lock:
+                for key, value in counts.items():
+                    totals[key] += value
+                totals['write_latencies'].extend(latencies)
+
+        threads = [threading.Thread(target=work, args=(options['seed'] + i,)) for i in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        totals['elapsed'] = time.perf_counter() - started
+
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM movement')
+            totals['recorded'] = cursor.fetchone()[0]
+        return totals
+
+    def report(self, mode, options, result):
+        elapsed = result['elapsed']
+        latencies = sorted(result['write_latencies'])
+        p95 = latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)] * 1000 if latencies else 0
+        self.stdout.write(
+            f'{mode}: {options["threads"]} threads, {elapsed:.1f}s: '
+            f'{result["reads"] / elapsed:,.0f} reads/s, {result["writes"] / elapsed:,.0f} writes/s '
+            f'(p95 {p95:.1f} ms), {result["read_errors"]:,} failed reads, '
+            f'{result["write_errors"]:,} failed writes'
+        )
+        if result['recorded'] != result['writes']:
+            self.stderr.write(self.style.ERROR(
+                f'{mode}: {result["recorded"]:,} writes recorded, expected {result["writes"]:,}'))
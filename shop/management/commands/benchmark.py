@@ -0,0 +1,368 @@
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import Resolver404, resolve, reverse
+
+from accounts import urls as accounts_urls
+from shop import urls as shop_urls
+from shop.models import Cart, CartItem, Category, Order, Product
+
+from .generate_data import BENCH_PASSWORD, NOUNS, USERNAME_PREFIX
+
+DELIVERY = {
+    'delivery_name': 'Bench Buyer',
+    'delivery_phone': '9999999999',
+    'delivery_address': '1 Market Road',
+    'delivery_city': 'Mumbai',
+    'delivery_state': 'Maharashtra',
+    'delivery_postal_code': '400001',
+    'stripeToken': 'tok_visa',
+}
+
+
+# What a successful request looks like: its status, where a redirect must
+# point (a URL name), and a queryset that must gain exactly one row
+Scenario = namedtuple('Scenario', ['prepare', 'status', 'redirect', 'creates'], defaults=[200, None, None])
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Worker:
+    """One simulated shopper: a logged-in client plus sample data to request"""
+
+    def __init__(self, user, sample, seed):
+        self.user = user
+        self.sample = sample
+        self.random = random.Random(seed)
+        self.client = self.new_client(login=True)
+        self.cart, _ = Cart.objects.get_or_create(user=user)
+        self.order_ids = list(Order.objects.filter(user=user).values_list('pk', flat=True)[:50])
+
+    def new_client(self, login=False):
+        client = Client(SERVER_NAME='localhost', raise_request_exception=False)
+        if login:
+            client.force_login(self.user)
+        return client
+
+    def cart_item(self):
+        item = CartItem.objects.filter(cart=self.cart).first()
+        if item is None:
+            item = CartItem.objects.create(
+                cart=self.cart, product_id=self.random.choice(self.sample.product_ids), quantity=1)
+        return item
+
+    def pick(self, values):
+        return self.random.choice(values)
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive every route in shop/urls.py and accounts/urls.py with concurrent in-process '
+        'clients and report throughput, latency percentiles and queries per request as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Timed requests per route (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Concurrent clients, one thread each (default: 4)')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Untimed requests per route before measuring (default: 5)')
+        parser.add_argument('--routes', nargs='+', metavar='NAME',
+                            help='Only run these routes, e.g. shop:home "shop:checkout (POST)"')
+        parser.add_argument('--payment-latency', type=float, default=0.0,
+                            help='Simulated payment provider latency in seconds (default: 0)')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--compare', metavar='REPORT',
+                            help='Print the change in p95 latency and queries against an earlier report')
+        parser.add_argument('--fail-on-regression', type=float, metavar='PERCENT',
+                            help='With --compare, exit with an error if any p95 grew by more than PERCENT')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+
+    def handle(self, *args, **options):
+        sample = self.load_sample()
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX, orders__isnull=False)
+                     .distinct().order_by('pk')[:options['concurrency']])
+        if len(users) < options['concurrency']:
+            raise CommandError(
+                f'Need {options["concurrency"]} generated users with orders; run generate_data first.')
+        if settings.DEBUG:
+            self.stderr.write('Warning: DEBUG is on, so timings include query logging overhead.')
+
+        scenarios = self.scenarios(sample)
+        self.check_coverage(scenarios)
+        if options['routes']:
+            unknown = set(options['routes']) - set(scenarios)
+            if unknown:
+                raise CommandError(f'Unknown routes: {", ".join(sorted(unknown))}')
+            scenarios = {name: scenarios[name] for name in options['routes']}
+
+        gateway = {'BACKEND': 'shop.payments.FakeGateway', 'OPTIONS': {'latency': options['payment_latency']}}
+        results = {}
+        with override_settings(PAYMENT_GATEWAY=gateway):
+            workers = [Worker(user, sample, options['seed'] + i) for i, user in enumerate(users)]
+            for name, scenario in scenarios.items():
+                self.stderr.write(f'{name} ...', ending='')
+                results[name] = self.run_route(scenario, workers, options['requests'], options['warmup'])
+                self.stderr.write(f' {results[name]["throughput_rps"]} req/s, '
+                                  f'p95 {results[name]["latency_ms"]["p95"]} ms')
+
+        report = {
+            'meta': self.meta(options),
+            'routes': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self.compare(options['compare'], report, options['fail_on_regression'])
+
+    def load_sample(self):
+        sample = SimpleNamespace()
+        sample.product_ids = list(Product.objects.filter(is_active=True, stock_quantity__gt=100)
+                                  .values_list('pk', flat=True)[:1000])
+        sample.product_slugs = list(Product.objects.filter(is_active=True).values_list('slug', flat=True)[:1000])
+        sample.category_slugs = list(Category.objects.filter(is_active=True).values_list('slug', flat=True))
+        if not (sample.product_ids and sample.category_slugs):
+            raise CommandError('No catalog to benchmark; run generate_data first.')
+        return sample
+
+    def scenarios(self, sample):
+        """Route name -> Scenario whose prepare(worker) returns (client, method, path, data)
+
+        ``prepare`` runs untimed, so it can create whatever state the request needs.
+        A response other than the scenario's expected outcome counts as an error.
+        """
+        def get(name, **kwargs):
+            return lambda worker: (worker.client, 'get', reverse(name, kwargs=kwargs), {})
+
+        def anonymous(name, method='get', data=None):
+            return lambda worker: (worker.new_client(), method, reverse(name), data(worker) if data else {})
+
+        def register_data(worker):
+            username = f'bench-reg-{uuid.uuid4().hex[:12]}'
+            return {'username': username, 'email': f'{username}@example.com', 'first_name': 'Bench',
+                    'last_name': 'User', 'phone_number': '9999999999',
+                    'password1': BENCH_PASSWORD, 'password2': BENCH_PASSWORD}
+
+        def logout(worker):
+            return worker.new_client(login=True), 'post', reverse('accounts:logout'), {}
+
+        def item_route(name, method='post', data=None):
+            def prepare(worker):
+                item = worker.cart_item()
+                return worker.client, method, reverse(name, kwargs={'item_id': item.pk}), data or {}
+            return prepare
+
+        def with_cart(method, data=None):
+            def prepare(worker):
+                worker.cart_item()
+                return worker.client, method, reverse('shop:checkout'), data or {}
+            return prepare
+
+        def order_route(name):
+            return lambda worker: (worker.client, 'get', reverse(name, kwargs={
+                'order_id': worker.pick(worker.order_ids)}), {})
+
+        def paid_orders(worker):
+            return Order.objects.filter(user=worker.user, payment_status='completed')
+
+        return {
+            'shop:home': Scenario(get('shop:home')),
+            'shop:category_products': Scenario(lambda worker: (worker.client, 'get', reverse(
+                'shop:category_products', kwargs={'slug': worker.pick(sample.category_slugs)}), {})),
+            'shop:product_detail': Scenario(lambda worker: (worker.client, 'get', reverse(
+                'shop:product_detail', kwargs={'slug': worker.pick(sample.product_slugs)}), {})),
+            'shop:search': Scenario(lambda worker: (worker.client, 'get', reverse('shop:search'),
+                                                    {'q': worker.pick(NOUNS)})),
+            'shop:search_suggestions': Scenario(lambda worker: (
+                worker.client, 'get', reverse('shop:search_suggestions'), {'q': worker.pick(NOUNS)[:3]})),
+            'shop:cart': Scenario(get('shop:cart')),
+            'shop:add_to_cart': Scenario(lambda worker: (worker.client, 'post', reverse(
+                'shop:add_to_cart', kwargs={'product_id': worker.pick(sample.product_ids)}), {'quantity': 1}),
+                302, 'shop:cart'),
+            'shop:add_to_cart (anonymous)': Scenario(lambda worker: (worker.new_client(), 'post', reverse(
+                'shop:add_to_cart', kwargs={'product_id': worker.pick(sample.product_ids)}), {'quantity': 1}),
+                302, 'shop:cart'),
+            'shop:cart (anonymous)': Scenario(anonymous('shop:cart')),
+            'shop:update_cart': Scenario(item_route('shop:update_cart', data={'quantity': 2}), 302, 'shop:cart'),
+            'shop:remove_from_cart': Scenario(item_route('shop:remove_from_cart'), 302, 'shop:cart'),
+            'shop:checkout': Scenario(with_cart('get')),
+            'shop:checkout (POST)': Scenario(with_cart('post', DELIVERY), 302, 'shop:order_confirmation',
+                                             paid_orders),
+            'shop:order_confirmation': Scenario(order_route('shop:order_confirmation')),
+            'shop:order_history': Scenario(get('shop:order_history')),
+            'shop:order_detail': Scenario(order_route('shop:order_detail')),
+            'accounts:register': Scenario(anonymous('accounts:register')),
+            'accounts:register (POST)': Scenario(anonymous('accounts:register', 'post', register_data),
+                                                 302, 'accounts:login'),
+            'accounts:login': Scenario(anonymous('accounts:login')),
+            'accounts:login (POST)': Scenario(lambda worker: (
+                worker.new_client(), 'post', reverse('accounts:login'),
+                {'username': worker.user.username, 'password': BENCH_PASSWORD}), 302, 'shop:home'),
+            'accounts:logout': Scenario(logout, 302, 'shop:home'),
+            'accounts:profile': Scenario(get('accounts:profile')),
+        }
+
+    def check_coverage(self, scenarios):
+        covered = {name.split(' ')[0] for name in scenarios}
+        for module in (shop_urls, accounts_urls):
+            for pattern in module.urlpatterns:
+                name = f'{module.app_name}:{pattern.name}'
+                if name not in covered:
+                    self.stderr.write(self.style.WARNING(f'No benchmark scenario for {name}'))
+
+    @contextmanager
+    def count_queries(self, counter):
+        def record(execute, sql, params, many, context):
+            if counter['active']:
+                counter['queries'] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            yield
+
+    def redirect_target(self, response):
+        location = urlsplit(response['Location']).path
+        try:
+            return resolve(location).view_name
+        except Resolver404:
+            return location
+
+    def run_route(self, scenario, workers, requests, warmup):
+        lock = threading.Lock()
+        samples = []
+        statuses = {}
+        redirects = {}
+        errors = 0
+
+        def drive(worker, count, timed):
+            nonlocal errors
+            counter = {'active': False, 'queries': 0}
+            try:
+                with self.count_queries(counter):
+                    for _ in range(count):
+                        client, method, path, data = scenario.prepare(worker)
+                        before = scenario.creates(worker).count() if scenario.creates else None
+                        counter.update(active=True, queries=0)
+                        started = time.perf_counter()
+                        try:
+                            response = getattr(client, method)(path, data)
+                        except Exception:
+                            response = None
+                        elapsed = time.perf_counter() - started
+                        counter['active'] = False
+                        if not timed:
+                            continue
+                        status = 'exception' if response is None else response.status_code
+                        target = self.redirect_target(response) if status in (301, 302) else None
+                        expected = status == scenario.status and target == scenario.redirect
+                        if expected and scenario.creates:
+                            expected = scenario.creates(worker).count() == before + 1
+                        with lock:
+                            samples.append((elapsed, counter['queries']))
+                            statuses[status] = statuses.get(status, 0) + 1
+                            if target:
+                                redirects[target] = redirects.get(target, 0) + 1
+                            if not expected:
+                                errors += 1
+            finally:
+                connection.close()
+
+        def run(total, timed):
+            shares = [total // len(workers) + (i < total % len(workers)) for i in range(len(workers))]
+            with ThreadPoolExecutor(len(workers)) as pool:
+                for future in [pool.submit(drive, worker, share, timed) for worker, share in zip(workers, shares)]:
+                    future.result()
+
+        run(warmup * len(workers), timed=False)
+        started = time.perf_counter()
+        run(requests, timed=True)
+        wall = time.perf_counter() - started
+
+        latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+        queries = [count for _, count in samples]
+        return {
+            'requests': len(samples),
+            'errors': errors,
+            'expected': {'status': scenario.status, 'redirect': scenario.redirect},
+            'status_codes': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            'redirects': dict(sorted(redirects.items())),
+            'throughput_rps': round(len(samples) / wall, 1) if wall else None,
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+                'p50': round(percentile(latencies, 0.50), 2) if latencies else None,
+                'p95': round(percentile(latencies, 0.95), 2) if latencies else None,
+                'p99': round(percentile(latencies, 0.99), 2) if latencies else None,
+                'max': round(latencies[-1], 2) if latencies else None,
+            },
+            'queries_per_request': {
+                'mean': round(sum(queries) / len(queries), 2) if queries else None,
+                'max': max(queries) if queries else None,
+            },
+        }
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                    text=True, check=True, cwd=settings.BASE_DIR).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'concurrency': options['concurrency'],
+            'requests_per_route': options['requests'],
+            'payment_latency': options['payment_latency'],
+            'products': Product.objects.count(),
+            'users': User.objects.count(),
+            'orders': Order.objects.count(),
+        }
+
+    def compare(self, path, report, threshold):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        self.stderr.write(f'\nAgainst {path} (commit {baseline["meta"].get("commit")}):')
+        for name, result in report['routes'].items():
+            before = baseline['routes'].get(name)
+            if not before or not before['latency_ms']['p95'] or not result['latency_ms']['p95']:
+                continue
+            old, new = before['latency_ms']['p95'], result['latency_ms']['p95']
+            change = (new - old) / old * 100
+            self.stderr.write(
+                f'  {name:32} p95 {old:8.2f} -> {new:8.2f} ms ({change:+6.1f}%)  '
+                f'queries {before["queries_per_request"]["mean"]} -> {result["queries_per_request"]["mean"]}')
+            if threshold is not None and change > threshold:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f'p95 regressed by more than {threshold}%: {", ".join(regressions)}')
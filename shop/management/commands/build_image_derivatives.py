@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.caching import bump_version
+from shop.categories import CATEGORY_NAMESPACE
+from shop.conditional import invalidate_catalog
+from shop.images import backfill_derivatives
+from shop.models import Category, Product
+from shop.rankings import invalidate_rankings
+
+
+class Command(BaseCommand):
+    help = 'Render resized WebP/JPEG copies of every product and category image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: one per CPU)')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-check images that already have copies')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rendered, failed = backfill_derivatives(
+            [Category.objects.all(), Product.objects.all()],
+            workers=options['workers'],
+            force=options['force'],
+            progress=lambda error: self.stderr.write(f'Skipped {error}'),
+        )
+        # Digests were written with bulk_update, which sends no signals
+        bump_version(CATEGORY_NAMESPACE)
+        invalidate_rankings()
+        invalidate_catalog()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} images ({failed} skipped) in {elapsed:.2f}s'))
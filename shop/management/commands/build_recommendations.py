@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.recommendations import CHUNK_SIZE, MIN_SUPPORT, TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild "frequently bought together" recommendations from paid orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K,
+                            help=f'Recommendations stored per product (default: {TOP_K})')
+        parser.add_argument('--min-support', type=int, default=MIN_SUPPORT,
+                            help=f'Orders a pair must share to be recommended (default: {MIN_SUPPORT})')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Order lines held in memory at once (default: {CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = build_recommendations(
+            k=options['top_k'],
+            min_support=options['min_support'],
+            chunk_size=options['chunk_size'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {written} recommendations in {elapsed:.2f}s'))
@@ -0,0 +1,229 @@
+import math
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from accounts.models import UserProfile
+from shop import search
+from shop.autocomplete import AUTOCOMPLETE_NAMESPACE
+from shop.caching import bump_version
+from shop.categories import refresh_product_counts
+from shop.conditional import invalidate_catalog
+from shop.models import Cart, CartItem, CartSummary, Category, Order, OrderItem, Product
+from shop.order_numbers import encode, permute, reserve_block
+from shop.orders import build_snapshot
+from shop.rankings import invalidate_rankings
+
+# Generated accounts share this password so the benchmark can log in as them
+BENCH_PASSWORD = 'bench-pass-123'
+USERNAME_PREFIX = 'bench-user-'
+
+# Rows at --scale 1
+BASE_COUNTS = {
+    'users': 1_000,
+    'categories': 12,
+    'products': 10_000,
+    'carts': 400,
+    'orders': 5_000,
+}
+
+ADJECTIVES = [
+    'Classic', 'Compact', 'Deluxe', 'Eco', 'Essential', 'Premium', 'Portable', 'Pro',
+    'Smart', 'Ultra', 'Vintage', 'Wireless', 'Handmade', 'Organic', 'Rugged', 'Slim',
+]
+NOUNS = [
+    'Backpack', 'Blender', 'Bottle', 'Candle', 'Chair', 'Charger', 'Headphones', 'Jacket',
+    'Kettle', 'Lamp', 'Mat', 'Notebook', 'Novel', 'Serum', 'Shoes', 'Speaker', 'Tent',
+    'Trimmer', 'Watch', 'Yoga Block',
+]
+CATEGORY_NAMES = [
+    'Electronics', 'Fashion', 'Home & Living', 'Sports & Fitness', 'Books & Media',
+    'Beauty & Health', 'Toys & Games', 'Grocery', 'Garden', 'Automotive', 'Pet Supplies',
+    'Stationery',
+]
+CITIES = [('Mumbai', 'Maharashtra'), ('Delhi', 'Delhi'), ('Bengaluru', 'Karnataka'),
+          ('Chennai', 'Tamil Nadu'), ('Kolkata', 'West Bengal'), ('Pune', 'Maharashtra')]
+
+
+class Command(BaseCommand):
+    help = 'Generate users, categories, products, carts and orders for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiply every base row count by this factor (default: 1)')
+        for name, count in BASE_COUNTS.items():
+            parser.add_argument(f'--{name}', type=int,
+                                help=f'Exact number of {name} (default: {count} x scale)')
+        parser.add_argument('--items-per-order', type=int, default=3,
+                            help='Mean number of lines per order (default: 3)')
+        parser.add_argument('--days', type=int, default=90,
+                            help='Spread order dates over this many past days (default: 90)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per bulk insert (default: 2000)')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        counts = {
+            name: options[name] if options[name] is not None else math.ceil(count * options['scale'])
+            for name, count in BASE_COUNTS.items()
+        }
+        if counts['categories'] < 1 or counts['products'] < 1:
+            raise CommandError('At least one category and one product are needed.')
+        self.run_id = format(int(time.time()), 'x')
+        started = time.perf_counter()
+
+        categories = self.timed(f'{counts["categories"]:,} categories',
+                                self.create_categories, counts['categories'])
+        products = self.timed(f'{counts["products"]:,} products',
+                              self.create_products, counts['products'], categories)
+        users = self.timed(f'{counts["users"]:,} users', self.create_users, counts['users'])
+        if users:
+            carts = min(counts['carts'], len(users))
+            self.timed(f'{carts:,} carts', self.create_carts, carts, users, products)
+            self.timed(f'{counts["orders"]:,} orders', self.create_orders, counts['orders'], users, products,
+                       options['items_per_order'], options['days'])
+
+        # Everything was bulk inserted, so nothing ran the Product signals
+        self.timed('search index', lambda: search.rebuild_index())
+        refresh_product_counts([category.pk for category in categories])
+        bump_version(AUTOCOMPLETE_NAMESPACE)
+        invalidate_rankings()
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(
+            f'Done in {time.perf_counter() - started:.1f}s. '
+            f'Generated users log in with the password "{BENCH_PASSWORD}".'))
+
+    def timed(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f'{label} in {time.perf_counter() - started:.2f}s')
+        return result
+
+    def bulk_create(self, model, rows):
+        with transaction.atomic():
+            return model.objects.bulk_create(rows, batch_size=self.batch_size)
+
+    def create_categories(self, count):
+        existing = list(Category.objects.all())
+        names = {category.name for category in existing}
+        new = []
+        for i in range(count - len(existing)):
+            name = CATEGORY_NAMES[i] if i < len(CATEGORY_NAMES) else f'Category {i + 1}'
+            if name in names:
+                name = f'{name} {self.run_id}'
+            new.append(Category(name=name, slug=slugify(name), display_order=len(existing) + i))
+        self.bulk_create(Category, new)
+        return list(Category.objects.all())[:count]
+
+    def create_products(self, count, categories):
+        now = timezone.now()
+        for offset in range(0, count, self.batch_size):
+            rows = []
+            for i in range(offset, min(offset + self.batch_size, count)):
+                name = f'{self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)} {self.run_id}-{i}'
+                rows.append(Product(
+                    category=self.random.choice(categories),
+                    name=name,
+                    slug=slugify(name),
+                    description=f'{name} for everyday use. ' * self.random.randint(1, 6),
+                    price=Decimal(self.random.randint(99, 999_999)) / 100,
+                    stock_quantity=self.random.choice([0, 5, 20, 100, 1000]),
+                    is_active=self.random.random() > 0.03,
+                ))
+            self.bulk_create(Product, rows)
+            # created_at is auto_now_add; spread it afterwards so listings look real
+            for product in rows:
+                product.created_at = now - timedelta(seconds=self.random.randrange(365 * 86400))
+            Product.objects.bulk_update(rows, ['created_at'])
+        # Carts and orders draw from what could actually be bought
+        return list(Product.objects.filter(is_active=True, stock_quantity__gt=0)
+                    .values_list('pk', 'price', 'name', 'slug'))
+
+    def create_users(self, count):
+        # Hashing is deliberately slow; every generated account shares one hash.
+        password = make_password(BENCH_PASSWORD)
+        start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        users = [
+            User(username=f'{USERNAME_PREFIX}{start + i:06d}', email=f'{USERNAME_PREFIX}{start + i}@example.com',
+                 first_name=self.random.choice(['Asha', 'Ravi', 'Meera', 'Arjun', 'Priya', 'Kabir']),
+                 password=password)
+            for i in range(count)
+        ]
+        self.bulk_create(User, users)
+        users = list(User.objects.filter(username__in=[user.username for user in users]))
+        self.bulk_create(UserProfile, [
+            UserProfile(user=user, phone_number=f'9{self.random.randrange(10**9):09d}') for user in users
+        ])
+        return users
+
+    def create_carts(self, count, users, products):
+        owners = self.random.sample(users, count)
+        Cart.objects.filter(user__in=owners).delete()
+        self.bulk_create(Cart, [Cart(user=user) for user in owners])
+        carts = list(Cart.objects.filter(user__in=owners))
+        items = []
+        for cart in carts:
+            for product in self.random.sample(products, min(len(products), self.random.randint(1, 5))):
+                items.append(CartItem(cart=cart, product_id=product[0], quantity=self.random.randint(1, 3)))
+        self.bulk_create(CartItem, items)
+        return carts
+
+    def create_orders(self, count, users, products, items_per_order, days):
+        if not products:
+            return
+        start, _ = reserve_block(count)
+        now = timezone.now()
+        for offset in range(0, count, self.batch_size):
+            orders, lines = [], []
+            for n in range(offset, min(offset + self.batch_size, count)):
+                picked = self.random.sample(
+                    products, min(len(products), max(1, int(self.random.expovariate(1 / items_per_order)))))
+                order_lines = [(product, self.random.randint(1, 3)) for product in picked]
+                summary = CartSummary.from_totals(
+                    sum(quantity for _, quantity in order_lines),
+                    sum(product[1] * quantity for product, quantity in order_lines))
+                city, state = self.random.choice(CITIES)
+                user = self.random.choice(users)
+                orders.append(Order(
+                    user=user,
+                    order_number=encode(permute(start + n)),
+                    status=self.random.choice(['processing', 'shipped', 'delivered', 'delivered']),
+                    payment_status='completed' if self.random.random() > 0.05 else 'failed',
+                    total_amount=summary.total,
+                    delivery_name=user.first_name,
+                    delivery_address=f'{self.random.randint(1, 999)} Market Road',
+                    delivery_city=city,
+                    delivery_state=state,
+                    delivery_postal_code=f'{self.random.randint(100000, 999999)}',
+                    delivery_phone='9999999999',
+                    snapshot=build_snapshot(
+                        ((SnapshotProduct(*product), quantity, product[1]) for product, quantity in order_lines),
+                        summary),
+                ))
+                lines.append(order_lines)
+            self.bulk_create(Order, orders)
+            self.bulk_create(OrderItem, [
+                OrderItem(order=order, product_id=product[0], quantity=quantity, price_snapshot=product[1])
+                for order, order_lines in zip(orders, lines)
+                for product, quantity in order_lines
+            ])
+            for order in orders:
+                order.created_at = now - timedelta(seconds=self.random.randrange(days * 86400))
+            Order.objects.bulk_update(orders, ['created_at'])
+
+
+class SnapshotProduct:
+    """The fields build_snapshot reads, from a (pk, price, name, slug) row"""
+
+    def __init__(self, pk, price, name, slug):
+        self.pk, self.price, self.name, self.slug = pk, price, name, slug
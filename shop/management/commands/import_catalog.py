@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_import import CHUNK_SIZE, CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSON Lines feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or '-' to read from stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Feed format (default: from the file extension, else csv)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Rows per transaction (default: {CHUNK_SIZE})')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create categories the feed mentions that do not exist yet')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the feed without writing anything')
+        parser.add_argument('--max-errors', type=int, default=20,
+                            help='Invalid rows to list before only counting them (default: 20)')
+
+    def handle(self, *args, **options):
+        if options['path'] != '-' and options['format'] is None and not options['path'].endswith(
+                ('.csv', '.jsonl', '.ndjson')):
+            self.stderr.write('Unknown file extension; reading as CSV')
+        importer = CatalogImporter(
+            chunk_size=options['chunk_size'],
+            create_categories=options['create_categories'],
+            dry_run=options['dry_run'],
+            max_errors=options['max_errors'],
+        )
+        try:
+            importer.run(read_rows(options['path'], options['format']), progress=self.progress)
+        except OSError as e:
+            raise CommandError(e)
+
+        for line_number, error in importer.errors:
+            self.stderr.write(f'Line {line_number}: {error}')
+        if importer.invalid > len(importer.errors):
+            self.stderr.write(f'... and {importer.invalid - len(importer.errors)} more invalid rows')
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Checked {importer.rows} rows: {importer.invalid} invalid'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.imported} products ({importer.created} new, '
+            f'{importer.imported - importer.created} updated), {importer.duplicates} duplicate rows, '
+            f'{importer.invalid} invalid'))
+        if importer.images:
+            self.stdout.write('Run build_image_derivatives to resize the imported images.')
+
+    def progress(self, importer, elapsed):
+        rate = importer.rows / elapsed if elapsed else 0
+        self.stdout.write(f'{importer.rows:,} rows read, {importer.imported:,} imported ({rate:,.0f} rows/s)')
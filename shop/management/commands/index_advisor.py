@@ -0,0 +1,141 @@
+import re
+from contextlib import contextmanager
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from shop import urls as shop_urls
+from shop.models import Cart, CartItem, Category, Product
+from shop.orders import place_order
+
+PLAN_SCAN = re.compile(r'^SCAN (\S+)(.*)$')
+TEMP_BTREE = 'USE TEMP B-TREE'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the queries behind each URL in shop/urls.py, run EXPLAIN QUERY PLAN '
+        'on them and flag full table scans and temporary B-tree sorts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the full plan of every query, not only flagged ones')
+        parser.add_argument('--fail-on-issues', action='store_true',
+                            help='Exit with an error if any query is flagged (for CI)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The index advisor reads SQLite query plans only.')
+        issues = 0
+        try:
+            with transaction.atomic():
+                fixture = self.build_fixture()
+                for name, kwargs in self.url_arguments(fixture):
+                    issues += self.replay(name, kwargs, fixture.user, options['verbose_plans'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if issues:
+            message = f'{issues} query plan issue{"s" if issues != 1 else ""} found'
+            if options['fail_on_issues']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('No full scans or temp B-tree sorts found'))
+
+    def build_fixture(self):
+        """Sample rows for URL arguments; everything is rolled back afterwards"""
+        category = Category.objects.filter(is_active=True).first()
+        if category is None:
+            category = Category.objects.create(name='Index Advisor Category')
+        product = Product.objects.filter(category=category, is_active=True, stock_quantity__gt=0).first()
+        if product is None:
+            product = Product.objects.create(
+                category=category, name='Index Advisor Product', description='Sample',
+                price=Decimal('10.00'), stock_quantity=100)
+        user = User.objects.create_user('index-advisor-replay')
+        cart = Cart.objects.create(user=user)
+        item = CartItem.objects.create(cart=cart, product=product, quantity=1)
+        order = place_order(user, [item], {
+            'delivery_name': 'Sample', 'delivery_phone': '0', 'delivery_address': 'Sample',
+            'delivery_city': 'Sample', 'delivery_state': 'Sample', 'delivery_postal_code': '0',
+        })
+        return SimpleNamespace(category=category, product=product, user=user, item=item, order=order)
+
+    def url_arguments(self, fixture):
+        samples = {
+            'category_products': {'slug': fixture.category.slug},
+            'product_detail': {'slug': fixture.product.slug},
+            'add_to_cart': {'product_id': fixture.product.pk},
+            'update_cart': {'item_id': fixture.item.pk},
+            'remove_from_cart': {'item_id': fixture.item.pk},
+            'order_confirmation': {'order_id': fixture.order.pk},
+            'order_detail': {'order_id': fixture.order.pk},
+        }
+        for pattern in shop_urls.urlpatterns:
+            if pattern.pattern.converters and pattern.name not in samples:
+                self.stdout.write(self.style.WARNING(f'Skipping {pattern.name}: no sample arguments'))
+                continue
+            yield pattern.name, samples.get(pattern.name, {})
+
+    @contextmanager
+    def capture(self):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            yield queries
+
+    def replay(self, name, kwargs, user, verbose):
+        url = reverse(f'{shop_urls.app_name}:{name}', kwargs=kwargs)
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(user)
+        params = {'q': 'sample'} if name in ('search', 'search_suggestions') else {}
+        # Inner savepoint so state-changing views don't affect later replays.
+        sid = transaction.savepoint()
+        # The first request warms the per-process caches; plan the steady state.
+        client.get(url, params)
+        transaction.savepoint_rollback(sid)
+        with self.capture() as queries:
+            sid = transaction.savepoint()
+            response = client.get(url, params)
+            transaction.savepoint_rollback(sid)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{name} ({url}) -> {response.status_code}'))
+        issues = 0
+        for sql, sql_params in queries:
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', sql_params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            flagged = [step for step in plan if self.is_problem(step)]
+            if flagged or verbose:
+                self.stdout.write(f'  {sql[:160]}{"..." if len(sql) > 160 else ""}')
+                for step in plan:
+                    style = self.style.ERROR if step in flagged else (lambda text: text)
+                    self.stdout.write(style(f'    {step}'))
+            issues += len(flagged)
+        return issues
+
+    @staticmethod
+    def is_problem(step):
+        if TEMP_BTREE in step:
+            return True
+        match = PLAN_SCAN.match(step)
+        # "SCAN t USING INDEX" walks an index in order; a bare SCAN reads the table.
+        return bool(match) and 'INDEX' not in match.group(2) and not match.group(1).startswith('CONSTANT')
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.sessions import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions in small batches, pausing between them so requests can write'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Sessions deleted per statement (default: 1000)')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to wait between batches (default: 0.05)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = purge_expired(
+            options['batch_size'], options['pause'],
+            progress=lambda count: self.stdout.write(f'{count:,} deleted', ending='\r'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted:,} expired sessions in {time.perf_counter() - started:.2f}s'))
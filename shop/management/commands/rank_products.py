@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.rankings import RANKING_SIZE, rebuild_rankings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the bestseller lists shown on the homepage and category pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=RANKING_SIZE,
+                            help=f'Products kept per list (default: {RANKING_SIZE})')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep rebuilding on a schedule instead of exiting')
+        parser.add_argument('--interval', type=float, default=900.0,
+                            help='Seconds between rebuilds in --loop mode (default: 900)')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.perf_counter()
+                written = rebuild_rankings(size=options['size'])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f'Stored {written} rankings in {elapsed:.2f}s'))
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+
+    def handle(self, *args, **kwargs):
+        if not search.is_supported():
+            raise CommandError('The product search index requires the SQLite backend.')
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} products'))
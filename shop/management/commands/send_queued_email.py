@@ -0,0 +1,62 @@
+import logging
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.outbox import BACKOFF_MAX, MAX_ATTEMPTS, deliver_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Send emails queued in the order outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Emails sent per batch (default: 100)')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help=f'Give up on an email after this many failures (default: {MAX_ATTEMPTS})')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new emails instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to wait between polls in --loop mode (default: 5)')
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        total_sent = total_failed = 0
+        outages = 0
+        try:
+            while True:
+                try:
+                    connection.open()
+                except Exception as e:
+                    if not options['loop']:
+                        raise CommandError(f'Could not connect to the mail server: {e}')
+                    # Back off while the mail server is down instead of exiting
+                    outages += 1
+                    delay = min(options['interval'] * 2 ** (outages - 1), BACKOFF_MAX.total_seconds())
+                    logger.warning('Could not connect to the mail server (%s); retrying in %.0fs', e, delay)
+                    time.sleep(delay)
+                    continue
+                outages = 0
+                sent, failed = deliver_pending(
+                    connection,
+                    batch_size=options['batch_size'],
+                    max_attempts=options['max_attempts'],
+                )
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f'Sent {sent}, failed {failed}')
+                if sent + failed == options['batch_size']:
+                    continue
+                if not options['loop']:
+                    break
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write(self.style.SUCCESS(f'Done: {total_sent} sent, {total_failed} failed'))
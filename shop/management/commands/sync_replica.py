@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from shop.conditional import invalidate_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into each alias in DATABASE_REPLICAS with the '
+        'online backup API, for trying out read replicas locally'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep copying on a schedule instead of exiting')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between copies in --loop mode (default: 5)')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured; set DATABASE_REPLICAS.')
+        for alias in [DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias} is not SQLite; use the database\'s own replication.')
+        try:
+            while True:
+                started = time.perf_counter()
+                self.sync()
+                self.stdout.write(self.style.SUCCESS(
+                    f'Copied to {", ".join(settings.DATABASE_REPLICAS)} in {time.perf_counter() - started:.2f}s'))
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def sync(self):
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias]
+            replica.ensure_connection()
+            # Readers keep their connections; each sees the new copy on its next transaction
+            primary.connection.backup(replica.connection)
+        # Pages cached while a replica was behind were tagged with the current
+        # catalog version; a new one makes browsers fetch them again.
+        invalidate_catalog()
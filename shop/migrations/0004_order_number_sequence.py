@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+
+def create_sequence_row(apps, schema_editor):
+    OrderNumberSequence = apps.get_model('shop', 'OrderNumberSequence')
+    OrderNumberSequence.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence_row, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-18 06:51
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_snapshots(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    lines = {}
+    for item in OrderItem.objects.select_related('product').order_by('pk').iterator():
+        lines.setdefault(item.order_id, []).append({
+            'product_id': item.product_id,
+            'name': item.product.name,
+            'slug': item.product.slug,
+            'quantity': item.quantity,
+            'price': str(item.price_snapshot),
+            'total': str(item.price_snapshot * item.quantity),
+        })
+    for order in Order.objects.iterator():
+        order_lines = lines.get(order.pk, [])
+        subtotal = sum((Decimal(line['total']) for line in order_lines), Decimal('0.00'))
+        order.snapshot = {
+            'lines': order_lines,
+            'subtotal': str(subtotal),
+            'shipping': str(order.total_amount - subtotal),
+            'total': str(order.total_amount),
+        }
+        order.save(update_fields=['snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_order_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='snapshot',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 06:52
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counts(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    Product = apps.get_model('shop', 'Product')
+    counts = dict(
+        Product.objects.filter(is_active=True).order_by()
+        .values_list('category').annotate(count=Count('*'))
+    )
+    for category in Category.objects.all():
+        Category.objects.filter(pk=category.pk).update(active_product_count=counts.get(category.pk, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_order_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 06:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_catalog_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('week', 'Last 7 days'), ('month', 'Last 30 days')], max_length=10)),
+                ('position', models.PositiveIntegerField()),
+                ('units_sold', models.PositiveIntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('computed_at', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='shop.product')),
+            ],
+            options={
+                'ordering': ['window', 'category', 'position'],
+                'indexes': [models.Index(fields=['category', 'window', 'position'], name='shop_ranking_list_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_product_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_digest',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_digest',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
@@ -1,5 +1,12 @@
+from collections import namedtuple
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.text import slugify
 from django.urls import reverse
 
@@ -10,14 +17,24 @@ class Category(models.Model):
     slug = models.SlugField(max_length=200, unique=True, blank=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Content hash naming the resized copies made by shop.images
+    image_digest = models.CharField(max_length=32, blank=True, editable=False)
     display_order = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    # Maintained by the Product signals in shop.signals
+    active_product_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ['display_order', 'name']
+        indexes = [
+            # Partial indexes match Django's bare "WHERE is_active" filter and
+            # serve the ORDER BY without a temporary B-tree.
+            models.Index(fields=['display_order', 'name'], condition=models.Q(is_active=True),
+                         name='shop_category_nav_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -39,6 +56,8 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Content hash naming the resized copies made by shop.images
+    image_digest = models.CharField(max_length=32, blank=True, editable=False)
     stock_quantity = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -46,6 +65,19 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['category', '-created_at', '-id'], condition=models.Q(is_active=True),
+                         name='shop_product_cat_listing_idx'),
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_active=True),
+                         name='shop_product_listing_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category so a move can update both categories' counts
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -63,22 +95,71 @@ class Product(models.Model):
         return self.stock_quantity > 0
 
 
+FREE_SHIPPING_THRESHOLD = Decimal('999')
+SHIPPING_FEE = Decimal('50')
+
+
+class CartSummary(namedtuple('CartSummary', ['total_items', 'subtotal', 'shipping', 'total'])):
+    """Item count and money totals for a cart"""
+    __slots__ = ()
+
+    @classmethod
+    def from_totals(cls, total_items, subtotal):
+        subtotal = Decimal(subtotal).quantize(Decimal('0.01'))
+        if not total_items or subtotal >= FREE_SHIPPING_THRESHOLD:
+            shipping = Decimal('0.00')
+        else:
+            shipping = SHIPPING_FEE
+        return cls(total_items, subtotal, shipping, subtotal + shipping)
+
+
+def cart_totals(prefix=''):
+    """Aggregate expressions for item count and subtotal of cart items.
+
+    ``prefix`` is the lookup path from the queried model to ``CartItem``,
+    e.g. ``'items__'`` when annotating ``Cart`` rows.
+    """
+    return {
+        'item_count': Coalesce(Sum(f'{prefix}quantity'), 0),
+        'subtotal_amount': Coalesce(
+            Sum(F(f'{prefix}quantity') * F(f'{prefix}product__price'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Decimal('0'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    }
+
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate each cart with ``item_count`` and ``subtotal_amount``"""
+        return self.annotate(**cart_totals('items__'))
+
+
 class Cart(models.Model):
     """Shopping cart model"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    @cached_property
+    def summary(self):
+        """Cart totals from a single aggregate query, memoized on the instance"""
+        totals = self.items.aggregate(**cart_totals())
+        return CartSummary.from_totals(totals['item_count'], totals['subtotal_amount'])
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.summary.total_items
 
     @property
     def subtotal(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.summary.subtotal
 
 
 class CartItem(models.Model):
@@ -132,23 +213,37 @@ class Order(models.Model):
     # Payment
     stripe_payment_id = models.CharField(max_length=200, blank=True)
     
+    # Line items and totals frozen at placement, so displaying an order
+    # needs no joins; see shop.orders.build_snapshot
+    snapshot = models.JSONField(default=dict, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='shop_order_user_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            import random
-            import string
-            self.order_number = 'SS' + ''.join(random.choices(string.digits, k=8))
+            from .order_numbers import next_order_number
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Order {self.order_number}"
 
 
+class OrderNumberSequence(models.Model):
+    """Single-row counter that order number blocks are reserved from"""
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Next order sequence value: {self.next_value}"
+
+
 class OrderItem(models.Model):
     """Order item model"""
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -162,3 +257,76 @@ class OrderItem(models.Model):
     @property
     def total_price(self):
         return self.price_snapshot * self.quantity
+
+
+class OutboundEmail(models.Model):
+    """Email queued in the transactional outbox, sent by the send_queued_email command"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails')
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='shop_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
+
+
+class ProductRanking(models.Model):
+    """Precomputed bestseller position, rebuilt by the rank_products command"""
+    WINDOW_CHOICES = [
+        ('week', 'Last 7 days'),
+        ('month', 'Last 30 days'),
+    ]
+
+    window = models.CharField(max_length=10, choices=WINDOW_CHOICES)
+    # Null for the site-wide list
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='rankings')
+    position = models.PositiveIntegerField()
+    units_sold = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=12, decimal_places=2)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['window', 'category', 'position']
+        indexes = [
+            models.Index(fields=['category', 'window', 'position'], name='shop_ranking_list_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.position} {self.product} ({self.window})"
+
+
+class ProductRecommendation(models.Model):
+    """Frequently-bought-together neighbour, rebuilt by the build_recommendations command"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    position = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['product', 'position']
+        indexes = [
+            models.Index(fields=['product', 'position'], name='shop_recommendation_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} -> {self.recommended}"
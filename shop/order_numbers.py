@@ -0,0 +1,121 @@
+"""Unique, non-guessable order numbers without check-then-insert queries.
+
+Each process reserves a block of sequence values from the single
+``OrderNumberSequence`` row with one atomic ``UPDATE`` and then hands them
+out from memory. Inside a caller's transaction a block could be rolled back
+and handed to another process while this one still holds it, so there a
+single value is taken in the caller's transaction instead. Every sequence
+value is passed through a keyed Feistel permutation of the 40-bit space,
+which is a bijection, so distinct sequence values always give distinct
+order numbers while consecutive orders look unrelated. The result is
+encoded as eight Crockford base32 characters after the ``SS-`` prefix.
+
+Flushing the database deletes the sequence row, so the next reservation
+starts again from zero. ``reserve_block`` notices when it has to recreate
+the row and bumps ``epoch``; the allocator drops any block reserved in an
+earlier epoch instead of handing out values that are being issued again.
+
+Older orders are numbered ``SS`` plus eight digits, and a code can be all
+digits too; the hyphen makes the new numbers a character longer, so the two
+schemes can never produce the same number.
+"""
+import hashlib
+import hmac
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import OrderNumberSequence
+
+PREFIX = 'SS-'
+BLOCK_SIZE = 100
+
+# Bumped whenever the sequence restarts; blocks from an older epoch are stale.
+epoch = 0
+
+HALF_BITS = 20
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32
+CODE_LENGTH = 8  # 8 x 5 bits = the 40-bit permutation domain
+
+
+def _round_key():
+    return hashlib.sha256(f'order-number:{settings.SECRET_KEY}'.encode()).digest()
+
+
+def _round(key, round_number, half):
+    digest = hmac.new(key, f'{round_number}:{half}'.encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:4], 'big') & HALF_MASK
+
+
+def permute(value, key=None):
+    """Map a sequence value onto a scrambled value in the same 40-bit space"""
+    key = key or _round_key()
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for round_number in range(ROUNDS):
+        left, right = right, left ^ _round(key, round_number, right)
+    return (left << HALF_BITS) | right
+
+
+def encode(value):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return PREFIX + ''.join(reversed(chars))
+
+
+def reserve_block(size=BLOCK_SIZE):
+    """Claim ``size`` sequence values; returns the half-open range (start, stop)"""
+    global epoch
+    with transaction.atomic():
+        sequence = OrderNumberSequence.objects.filter(pk=1)
+        if not sequence.update(next_value=F('next_value') + size):
+            _, created = OrderNumberSequence.objects.get_or_create(pk=1)
+            if created:
+                epoch += 1
+            sequence.update(next_value=F('next_value') + size)
+        stop = sequence.values_list('next_value', flat=True).get()
+    return stop - size, stop
+
+
+class OrderNumberAllocator:
+    """Thread-safe allocator handing out numbers from reserved blocks"""
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._key = None
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._next = self._stop = 0
+        self._epoch = epoch
+
+    def allocate(self):
+        if self._key is None:
+            self._key = _round_key()
+        if transaction.get_connection().in_atomic_block:
+            value, _ = reserve_block(1)
+        else:
+            with self._lock:
+                if self._next >= self._stop or self._epoch != epoch:
+                    self._next, self._stop = reserve_block(self.block_size)
+                    self._epoch = epoch
+                value = self._next
+                self._next += 1
+        return encode(permute(value, self._key))
+
+
+allocator = OrderNumberAllocator()
+
+# A forked child must not reuse the block its parent had already reserved.
+os.register_at_fork(after_in_child=allocator.reset)
+
+
+def next_order_number():
+    return allocator.allocate()
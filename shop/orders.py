@@ -0,0 +1,119 @@
+"""Order placement: turning a cart into an order and reserving its stock"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .conditional import invalidate_catalog
+from .models import CartItem, CartSummary, Order, OrderItem, Product
+from .order_numbers import next_order_number
+from .outbox import enqueue_order_confirmation
+
+
+class OutOfStock(Exception):
+    """Raised when a product no longer has enough stock for an order line"""
+
+    def __init__(self, product, requested):
+        self.product = product
+        self.requested = requested
+        super().__init__(f'Insufficient stock for {product.name}')
+
+
+def build_snapshot(lines, summary):
+    """Denormalized copy of an order's lines and totals for display.
+
+    ``lines`` yields ``(product, quantity, unit_price)``; money is stored as
+    strings so the JSON round-trips exactly.
+    """
+    return {
+        'lines': [
+            {
+                'product_id': product.pk,
+                'name': product.name,
+                'slug': product.slug,
+                'quantity': quantity,
+                'price': str(price),
+                'total': str(price * quantity),
+            }
+            for product, quantity, price in lines
+        ],
+        'subtotal': str(summary.subtotal),
+        'shipping': str(summary.shipping),
+        'total': str(summary.total),
+    }
+
+
+def place_order(user, cart_items, delivery):
+    """Create a pending order for ``cart_items`` and reserve its stock.
+
+    Everything happens in one transaction: the order row, a bulk insert of
+    its items and one conditional ``UPDATE`` per product that only succeeds
+    while enough stock is left. If any product would be oversold the whole
+    order is rolled back and ``OutOfStock`` is raised. ``cart_items`` must
+    have their products loaded; ``delivery`` holds the ``delivery_*`` fields.
+    """
+    cart_items = list(cart_items)
+    summary = CartSummary.from_totals(
+        sum(item.quantity for item in cart_items),
+        sum(item.total_price for item in cart_items),
+    )
+    snapshot = build_snapshot(
+        ((item.product, item.quantity, item.product.price) for item in cart_items), summary)
+    now = timezone.now()
+    # Allocate outside the transaction so the number comes from this
+    # process's reserved block rather than a write inside the transaction.
+    order_number = next_order_number()
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user, order_number=order_number, total_amount=summary.total,
+            snapshot=snapshot, **delivery)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item.product,
+                quantity=item.quantity,
+                price_snapshot=item.product.price,
+            )
+            for item in cart_items
+        ])
+        for item in cart_items:
+            reserved = Product.objects.filter(
+                pk=item.product_id,
+                stock_quantity__gte=item.quantity,
+            ).update(stock_quantity=F('stock_quantity') - item.quantity, updated_at=now)
+            if not reserved:
+                raise OutOfStock(item.product, item.quantity)
+    # Product pages show stock levels
+    invalidate_catalog()
+    return order
+
+
+def complete_order(order, payment_id, cart_items):
+    """Mark a placed order as paid, clear its cart lines and queue its email"""
+    with transaction.atomic():
+        Order.objects.filter(pk=order.pk).update(
+            payment_status='completed',
+            status='processing',
+            stripe_payment_id=payment_id,
+            updated_at=timezone.now(),
+        )
+        CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        order.payment_status = 'completed'
+        order.status = 'processing'
+        order.stripe_payment_id = payment_id
+        enqueue_order_confirmation(order)
+    return order
+
+
+def cancel_order(order):
+    """Release the stock reserved by an unpaid order and mark it failed"""
+    now = timezone.now()
+    with transaction.atomic():
+        for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+            Product.objects.filter(pk=product_id).update(
+                stock_quantity=F('stock_quantity') + quantity, updated_at=now)
+        Order.objects.filter(pk=order.pk).update(
+            payment_status='failed', status='cancelled', updated_at=now)
+    invalidate_catalog()
+    order.payment_status = 'failed'
+    order.status = 'cancelled'
+    return order
@@ -0,0 +1,93 @@
+"""Transactional outbox for order emails.
+
+Emails are written to ``OutboundEmail`` inside the same transaction as the
+order change that triggers them, so a committed order always has its email
+queued and a rolled-back one never does. ``manage.py send_queued_email``
+delivers the queue in batches over one reused mail connection, retrying
+failures with exponential backoff. Run a single worker per database.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+
+
+def enqueue_email(subject, body, recipients, order=None, from_email=None):
+    """Queue an email; call inside the transaction that makes it necessary"""
+    return OutboundEmail.objects.create(
+        order=order,
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def enqueue_order_confirmation(order):
+    return enqueue_email(
+        subject=f'Order Confirmation - {order.order_number}',
+        body=f'Thank you for your order! Your order number is {order.order_number}. Total amount: ₹{order.total_amount}',
+        recipients=[order.user.email],
+        order=order,
+    )
+
+
+def backoff(attempts):
+    """Delay before retry number ``attempts`` (1-based)"""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def deliver_pending(connection, batch_size=100, max_attempts=MAX_ATTEMPTS):
+    """Send one batch of due emails over ``connection``.
+
+    Returns ``(sent, failed)`` counts for the batch; ``failed`` includes
+    messages rescheduled for a retry.
+    """
+    now = timezone.now()
+    batch = list(
+        OutboundEmail.objects.filter(status='pending', next_attempt_at__lte=now)[:batch_size]
+    )
+    sent_ids = []
+    failed = []
+    for email in batch:
+        recipients = [address for address in email.recipients if address and address.strip()]
+        if not recipients:
+            # Retrying can't help, e.g. an order placed by a user without an email
+            email.status = 'failed'
+            email.last_error = 'No recipients'
+            failed.append(email)
+            continue
+        message = EmailMessage(
+            subject=email.subject,
+            body=email.body,
+            from_email=email.from_email,
+            to=recipients,
+            connection=connection,
+        )
+        try:
+            message.send()
+        except Exception as e:
+            email.attempts += 1
+            email.last_error = str(e)
+            if email.attempts >= max_attempts:
+                email.status = 'failed'
+            else:
+                email.next_attempt_at = now + backoff(email.attempts)
+            failed.append(email)
+        else:
+            sent_ids.append(email.pk)
+
+    if sent_ids:
+        OutboundEmail.objects.filter(pk__in=sent_ids).update(
+            status='sent', sent_at=timezone.now(), last_error='')
+    if failed:
+        OutboundEmail.objects.bulk_update(
+            failed, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return len(sent_ids), len(failed)
@@ -0,0 +1,105 @@
+"""Keyset (seek) pagination on ``(created_at, id)``, newest first.
+
+Unlike ``OFFSET`` pagination, every page is one indexed range scan of
+``per_page + 1`` rows, however deep the reader goes, and no ``COUNT(*)`` is
+needed. Pages are addressed by opaque cursors taken from the first or last
+row of the neighbouring page.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+# Signed 64-bit, the range of SQLite's integers
+MIN_PK, MAX_PK = -2 ** 63, 2 ** 63 - 1
+
+
+def encode_cursor(obj):
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` for a cursor, or None if it is malformed
+
+    Cursors come from the query string unsigned, so anything the database
+    can't compare against the columns (naive datetimes, ids beyond SQLite's
+    64-bit integers) counts as malformed too.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        created_at, pk = datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if timezone.is_naive(created_at) or not MIN_PK <= pk <= MAX_PK:
+        return None
+    return created_at, pk
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` newest first by ``(created_at, id)``"""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def get_page(self, after=None, before=None):
+        """Return the page after cursor ``after``, before cursor ``before``,
+        or the first page when neither is a valid cursor."""
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+        if before and not after:
+            created_at, pk = before
+            rows = list(
+                self.queryset
+                .filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+                .order_by('created_at', 'pk')[:self.per_page + 1]
+            )
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(
+                rows,
+                next_cursor=encode_cursor(rows[-1]) if rows else None,
+                previous_cursor=encode_cursor(rows[0]) if more else None,
+            )
+
+        queryset = self.queryset
+        if after:
+            created_at, pk = after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        rows = list(queryset.order_by('-created_at', '-pk')[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1]) if more else None,
+            previous_cursor=encode_cursor(rows[0]) if after and rows else None,
+        )
@@ -0,0 +1,111 @@
+"""Pluggable payment gateways.
+
+The gateway used by checkout is configured with the ``PAYMENT_GATEWAY``
+setting::
+
+    PAYMENT_GATEWAY = {
+        'BACKEND': 'shop.payments.FakeGateway',
+        'OPTIONS': {'latency': 0.3},
+    }
+
+Every gateway offers a blocking ``charge()`` and an awaitable ``acharge()``.
+The async checkout view awaits the latter, so under ASGI a slow payment
+provider holds neither a worker thread nor the event loop.
+"""
+import asyncio
+import functools
+import time
+import uuid
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class PaymentError(Exception):
+    """The payment could not be taken"""
+
+
+class PaymentDeclined(PaymentError):
+    """The payment method was refused, e.g. a declined card"""
+
+
+class PaymentGateway:
+    """Base class for payment gateways.
+
+    Subclasses implement ``charge()``; ``acharge()`` defaults to running it
+    in a thread and should be overridden when the provider has a native
+    async client. ``amount`` is in the currency's minor unit (paise).
+    Both return the provider's payment id.
+    """
+
+    def charge(self, amount, currency, source, description):
+        raise NotImplementedError
+
+    async def acharge(self, amount, currency, source, description):
+        return await sync_to_async(self.charge, thread_sensitive=False)(
+            amount, currency, source, description)
+
+
+class StripeGateway(PaymentGateway):
+    """Charges through the Stripe Charges API"""
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key or settings.STRIPE_SECRET_KEY
+
+    def charge(self, amount, currency, source, description):
+        try:
+            charge = stripe.Charge.create(
+                amount=amount,
+                currency=currency,
+                source=source,
+                description=description,
+                api_key=self.api_key,
+            )
+        except stripe.error.CardError as e:
+            raise PaymentDeclined(e.user_message or str(e)) from e
+        except stripe.error.StripeError as e:
+            raise PaymentError(str(e)) from e
+        return charge.id
+
+
+class FakeGateway(PaymentGateway):
+    """In-process stand-in for a payment provider.
+
+    Sleeps for ``latency`` seconds to mimic the provider round-trip, declines
+    the tokens listed in ``decline_sources`` and approves everything else.
+    Useful for tests and for benchmarking checkout throughput offline.
+    """
+
+    def __init__(self, latency=0.0, decline_sources=('tok_chargeDeclined',)):
+        self.latency = latency
+        self.decline_sources = set(decline_sources)
+
+    def _result(self, source):
+        if source in self.decline_sources:
+            raise PaymentDeclined('Your card was declined.')
+        return f'fake_{uuid.uuid4().hex}'
+
+    def charge(self, amount, currency, source, description):
+        time.sleep(self.latency)
+        return self._result(source)
+
+    async def acharge(self, amount, currency, source, description):
+        await asyncio.sleep(self.latency)
+        return self._result(source)
+
+
+@functools.cache
+def get_gateway():
+    """Return the gateway configured by ``settings.PAYMENT_GATEWAY``"""
+    config = settings.PAYMENT_GATEWAY
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_gateway(setting, **kwargs):
+    if setting == 'PAYMENT_GATEWAY':
+        get_gateway.cache_clear()
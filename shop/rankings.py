@@ -0,0 +1,122 @@
+"""Bestseller lists for the homepage and category listings.
+
+The ``rank_products`` command aggregates paid ``OrderItem`` sales over
+sliding windows, globally and per category, and stores the ordered lists in
+``ProductRanking``. Each worker keeps the lists it has served in memory,
+keyed by the ``rankings`` version in the shared cache, so a page view costs
+one cache read; the version is bumped by a rebuild and by catalog edits.
+"""
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .caching import bump_version, get_version
+from .conditional import invalidate_catalog
+from .models import OrderItem, Product, ProductRanking
+from .routers import primary
+
+RANKING_NAMESPACE = 'rankings'
+
+# Short windows first: they are preferred when filling a list.
+WINDOWS = {
+    'week': timedelta(days=7),
+    'month': timedelta(days=30),
+}
+
+# Products kept per list
+RANKING_SIZE = 12
+
+_lock = threading.Lock()
+_state = {'version': None, 'lists': {}}
+
+
+def invalidate_rankings():
+    bump_version(RANKING_NAMESPACE)
+
+
+def compute_rankings(now=None, size=RANKING_SIZE):
+    """Return unsaved ``ProductRanking`` rows for every window and category"""
+    now = now or timezone.now()
+    rows = []
+    for window, length in WINDOWS.items():
+        sales = (OrderItem.objects
+                 .filter(order__payment_status='completed',
+                         order__created_at__gte=now - length,
+                         product__is_active=True)
+                 .values('product', 'product__category')
+                 .annotate(units=Sum('quantity'), revenue=Sum(F('quantity') * F('price_snapshot')))
+                 .order_by('-units', '-revenue', 'product'))
+        lists = defaultdict(list)
+        for sale in sales.iterator():
+            for category_id in (None, sale['product__category']):
+                if len(lists[category_id]) < size:
+                    lists[category_id].append(sale)
+        for category_id, ranked in lists.items():
+            rows.extend(
+                ProductRanking(
+                    window=window,
+                    category_id=category_id,
+                    product_id=sale['product'],
+                    position=position,
+                    units_sold=sale['units'],
+                    revenue=sale['revenue'],
+                    computed_at=now,
+                )
+                for position, sale in enumerate(ranked, start=1)
+            )
+    return rows
+
+
+def rebuild_rankings(now=None, size=RANKING_SIZE):
+    """Replace the stored rankings and return how many rows were written"""
+    rows = compute_rankings(now, size)
+    with transaction.atomic():
+        ProductRanking.objects.all().delete()
+        ProductRanking.objects.bulk_create(rows)
+    invalidate_rankings()
+    invalidate_catalog()
+    return len(rows)
+
+
+def _load_list(category_id, size):
+    rankings = (ProductRanking.objects
+                .filter(category_id=category_id, product__is_active=True)
+                .select_related('product')
+                .order_by('position'))
+    products = {}
+    for window in WINDOWS:
+        for ranking in rankings.filter(window=window)[:size]:
+            products.setdefault(ranking.product_id, ranking.product)
+        if len(products) >= size:
+            break
+    products = list(products.values())[:size]
+    if category_id is None and len(products) < size:
+        # Not enough sales yet; top up the homepage with the newest arrivals.
+        products += Product.objects.filter(is_active=True).exclude(
+            pk__in=[product.pk for product in products])[:size - len(products)]
+    return products
+
+
+def get_bestsellers(category=None, limit=8):
+    """Return up to ``limit`` bestselling products, site-wide or for ``category``
+
+    The site-wide list is padded with the newest products when there are not
+    enough sales to fill it; category lists only contain products that sold.
+    """
+    version = get_version(RANKING_NAMESPACE)
+    key = (category.pk if category else None, limit)
+    if _state['version'] != version:
+        with _lock:
+            if _state['version'] != version:
+                _state.update(version=version, lists={})
+    lists = _state['lists']
+    if key not in lists:
+        with _lock:
+            if key not in lists:
+                with primary():
+                    lists[key] = _load_list(key[0], limit)
+    return lists[key]
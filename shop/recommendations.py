@@ -0,0 +1,116 @@
+"""Item-to-item "bought together" recommendations from order history.
+
+Paid order lines are streamed in order-id order and folded, one chunk of
+orders at a time, into a sparse product-by-product co-occurrence matrix
+(``B.T @ B`` for each chunk's order/product incidence matrix ``B``). Memory
+is bounded by the chunk size plus the number of distinct co-purchased pairs,
+never by the number of order lines. Co-occurrence counts are normalised to
+cosine similarity and the top neighbours of each product are stored in
+``ProductRecommendation`` for the detail page to read with one query.
+"""
+import numpy as np
+from scipy import sparse
+
+from django.db import transaction
+
+from .conditional import invalidate_catalog
+from .models import OrderItem, Product, ProductRecommendation
+
+TOP_K = 4
+MIN_SUPPORT = 2
+CHUNK_SIZE = 50_000
+
+
+def iter_order_chunks(chunk_size=CHUNK_SIZE):
+    """Yield (order_ids, product_ids) arrays, never splitting an order across chunks"""
+    lines = (OrderItem.objects
+             .filter(order__payment_status='completed')
+             .order_by('order_id')
+             .values_list('order_id', 'product_id')
+             .iterator(chunk_size=chunk_size))
+    orders, products = [], []
+    for order_id, product_id in lines:
+        if len(orders) >= chunk_size and order_id != orders[-1]:
+            yield np.array(orders, dtype=np.int64), np.array(products, dtype=np.int64)
+            orders, products = [], []
+        orders.append(order_id)
+        products.append(product_id)
+    if orders:
+        yield np.array(orders, dtype=np.int64), np.array(products, dtype=np.int64)
+
+
+def co_occurrence(product_ids, chunks):
+    """Return the sparse matrix of how many orders contain each pair of products
+
+    ``product_ids`` is the sorted array of product keys that index the rows
+    and columns; lines for other products are ignored.
+    """
+    size = len(product_ids)
+    counts = sparse.csr_matrix((size, size), dtype=np.int64)
+    for orders, products in chunks:
+        columns = np.searchsorted(product_ids, products)
+        known = (columns < size) & (product_ids[np.minimum(columns, size - 1)] == products)
+        rows = np.unique(orders[known], return_inverse=True)[1]
+        incidence = sparse.csr_matrix(
+            (np.ones(rows.size, dtype=np.int64), (rows, columns[known])),
+            shape=(rows.max() + 1 if rows.size else 0, size))
+        # The same product twice in one order still counts once
+        incidence.data[:] = 1
+        counts = counts + (incidence.T @ incidence).tocsr()
+    return counts
+
+
+def cosine_similarity(counts, min_support=MIN_SUPPORT):
+    """Scale co-occurrence counts by each product's order count"""
+    orders_per_product = counts.diagonal().astype(np.float64)
+    counts = counts.tolil()
+    counts.setdiag(0)
+    counts = counts.tocsr()
+    counts.data[counts.data < min_support] = 0
+    counts.eliminate_zeros()
+    with np.errstate(divide='ignore'):
+        inverse_norm = np.where(orders_per_product > 0, 1 / np.sqrt(orders_per_product), 0)
+    scale = sparse.diags(inverse_norm)
+    return (scale @ counts.astype(np.float64) @ scale).tocsr()
+
+
+def top_neighbours(similarity, k=TOP_K):
+    """Yield (row, columns, scores) with each row's ``k`` best columns, best first"""
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        columns = similarity.indices[start:end]
+        if scores.size > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            scores, columns = scores[best], columns[best]
+        # Ties broken by column so rebuilds are stable
+        order = np.lexsort((columns, -scores))
+        yield row, columns[order], scores[order]
+
+
+def build_recommendations(k=TOP_K, min_support=MIN_SUPPORT, chunk_size=CHUNK_SIZE):
+    """Recompute and store every product's recommendations; return rows written"""
+    product_ids = np.array(
+        Product.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True),
+        dtype=np.int64)
+    if not product_ids.size:
+        return 0
+    similarity = cosine_similarity(
+        co_occurrence(product_ids, iter_order_chunks(chunk_size)), min_support)
+    rows = [
+        ProductRecommendation(
+            product_id=int(product_ids[row]),
+            recommended_id=int(product_ids[column]),
+            position=position,
+            score=float(score),
+        )
+        for row, columns, scores in top_neighbours(similarity, k)
+        for position, (column, score) in enumerate(zip(columns, scores), start=1)
+    ]
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=1000)
+    invalidate_catalog()
+    return len(rows)
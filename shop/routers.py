@@ -0,0 +1,130 @@
+"""Read/write splitting between the primary database and read replicas.
+
+While a request is being served, catalog and order-history reads go to a
+random alias from ``DATABASE_REPLICAS``; all writes, and every other read,
+go to ``default``. Reads stay on the primary:
+
+* inside a transaction, so a read-modify-write sees its own rows;
+* for POST (and other unsafe) requests, and for the rest of any request
+  once it has written;
+* for ``REPLICA_PIN_SECONDS`` after a browser's last POST, through a cookie
+  set by ``ReplicaPinMiddleware``, so people see their own orders and edits
+  while the replicas catch up;
+* outside requests (management commands, workers), and inside ``primary()``.
+
+With no replicas configured the router routes nothing.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'pin_primary'
+
+# Models whose reads may be served by a replica
+REPLICA_MODELS = frozenset([
+    'shop.category', 'shop.product', 'shop.productranking', 'shop.productrecommendation',
+    'shop.order', 'shop.orderitem',
+])
+
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class RoutingState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+@contextmanager
+def primary():
+    """Send the reads in this block to the primary
+
+    For data cached beyond the request, which must not be built from a
+    replica that is behind.
+    """
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    pinned, state.pinned = state.pinned, True
+    try:
+        yield
+    finally:
+        state.pinned = pinned
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (not settings.DATABASE_REPLICAS or state is None or state.pinned or state.wrote
+                or model._meta.label_lower not in REPLICA_MODELS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Rows read from a replica are saved back to the primary
+        return DEFAULT_DB_ALIAS if settings.DATABASE_REPLICAS else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, schema included
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Track writes per request and pin browsers that POST to the primary"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        # Sync views run in a copy of this context and share its RoutingState
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response)
+
+    def start(self, request):
+        unsafe = request.method in UNSAFE_METHODS
+        return _state.set(RoutingState(pinned=unsafe or PIN_COOKIE in request.COOKIES))
+
+    def finish(self, request, response):
+        if settings.DATABASE_REPLICAS and request.method in UNSAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
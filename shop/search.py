@@ -0,0 +1,145 @@
+"""Full-text product search backed by an SQLite FTS5 index.
+
+The ``shop_product_fts`` virtual table is created by migration 0002 and
+mirrors every active product. It is kept current by the ``Product`` signals
+in ``shop.signals`` and rebuilt from scratch with ``manage.py
+rebuild_search_index``. Other database backends fall back to a plain
+``icontains`` filter.
+"""
+import re
+
+from django.db import connection, connections, router
+from django.db.models import Q
+
+from .models import Product
+
+FTS_TABLE = 'shop_product_fts'
+
+# Relative BM25 weights of the indexed columns: a hit in the product name
+# counts for much more than one in the description.
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_expression(query):
+    """Turn free text into an FTS5 query matching every term as a prefix.
+
+    Terms are quoted so FTS5 operators typed by users are treated as text.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def index_product(product):
+    """Add, refresh or drop one product's index entry"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        if product.is_active:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+                [product.pk, product.name, product.description],
+            )
+
+
+def remove_product(product_id):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_index(product_ids=None):
+    """Repopulate the index from ``shop_product``.
+
+    With ``product_ids`` only those rows are refreshed; otherwise the whole
+    index is rebuilt and merged into a single b-tree. Returns the number of
+    products indexed.
+    """
+    if not is_supported():
+        return 0
+    product_table = Product._meta.db_table
+    with connection.cursor() as cursor:
+        if product_ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            where, params = '', []
+        else:
+            product_ids = list(product_ids)
+            if not product_ids:
+                return 0
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+            where, params = f' AND id IN ({placeholders})', product_ids
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+            f'SELECT id, name, description FROM {product_table} WHERE is_active{where}',
+            params,
+        )
+        indexed = cursor.rowcount
+        if product_ids is None:
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+class SearchResults:
+    """Lazily evaluated, BM25-ranked search hits.
+
+    Supports ``count()`` and slicing so it can be handed straight to Django's
+    ``Paginator``; each page costs one ranked ``LIMIT``/``OFFSET`` query on the
+    index plus one primary-key lookup for the products on that page.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.match = build_match_expression(query)
+        # The index is read with raw SQL, so pick the database the router would
+        self.db = router.db_for_read(Product)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            else:
+                with connections[self.db].cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                        [self.match],
+                    )
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if not self.match or stop <= start:
+            return []
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, %s, %s) LIMIT %s OFFSET %s',
+                [self.match, NAME_WEIGHT, DESCRIPTION_WEIGHT, stop - start, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        products = Product.objects.using(self.db).filter(is_active=True).in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
+
+
+def search_products(query):
+    """Return the active products matching ``query``, best matches first"""
+    if is_supported():
+        return SearchResults(query)
+    return Product.objects.filter(
+        Q(name__icontains=query) | Q(description__icontains=query),
+        is_active=True,
+    )
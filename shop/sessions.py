@@ -0,0 +1,227 @@
+"""Session engine: per-worker LRU, then the shared cache, then the database.
+
+With ``SESSION_WRITE_BEHIND`` off this is Django's cached_db engine: every
+change is written to the database and the cache. Turning it on needs a
+cache that every server process shares (Redis, Memcached), which
+``check_shared_cache`` enforces at startup: the stamps and entries below
+are how workers see each other's changes.
+
+Each worker then keeps recently used sessions, decoded, in an LRU. Every
+save stores the session in the shared cache together with a fresh stamp,
+and a load first reads just that stamp; when it matches the worker's copy
+the session is served without fetching or unpickling it again, and a
+session changed or deleted through another worker is never served stale.
+
+Creating a session writes its row at once, so keys stay unique and a login
+survives a cache flush. Later changes are only queued; the queue is flushed
+with one bulk UPDATE after a request once ``SESSION_WRITE_BEHIND_SECONDS``
+have passed or ``SESSION_WRITE_BEHIND_BATCH`` sessions are waiting, and at
+exit. Flushes never insert, so a session deleted at logout can't come back.
+A session evicted from the cache before its changes are flushed loses at
+most that window of changes.
+"""
+import atexit
+import copy
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.db import DatabaseError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'shop.sessions'
+
+# Cache backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_CACHES = frozenset([
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+])
+
+
+def check_shared_cache():
+    """Refuse write-behind over a cache that other server processes can't see"""
+    if settings.SESSION_ENGINE != __name__ or not settings.SESSION_WRITE_BEHIND:
+        return
+    backend = settings.CACHES[settings.SESSION_CACHE_ALIAS]['BACKEND']
+    if backend in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            f'SESSION_WRITE_BEHIND needs a cache shared by all processes, but '
+            f'{settings.SESSION_CACHE_ALIAS!r} uses {backend}. Point it at Redis or '
+            f'Memcached, or turn SESSION_WRITE_BEHIND off.')
+
+
+class LocalSessions:
+    """Thread-safe LRU of (stamp, expires_at, data) by cache key"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, stamp):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != stamp or entry[1] <= time.time():
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.SESSION_LOCAL_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = LocalSessions()
+
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def flush_pending_writes(force=False):
+    """Write queued session changes if a flush is due; return how many were written
+
+    A failed write is logged and the changes stay queued for the next flush.
+    """
+    global _last_flush
+    with _pending_lock:
+        due = (force or len(_pending) >= settings.SESSION_WRITE_BEHIND_BATCH
+               or time.monotonic() - _last_flush >= settings.SESSION_WRITE_BEHIND_SECONDS)
+        if not _pending or not due:
+            return 0
+        sessions = list(_pending.values())
+        _pending.clear()
+        _last_flush = time.monotonic()
+    try:
+        SessionStore.get_model_class().objects.bulk_update(
+            sessions, ['session_data', 'expire_date'], batch_size=settings.SESSION_WRITE_BEHIND_BATCH)
+    except DatabaseError:
+        # Logged rather than raised: this runs after the response is sent
+        logger.warning('Could not write %d queued sessions; will retry', len(sessions), exc_info=True)
+        with _pending_lock:
+            for session in sessions:
+                # Anything queued since is newer
+                _pending.setdefault(session.session_key, session)
+        return 0
+    return len(sessions)
+
+
+@atexit.register
+def _flush_at_exit():
+    flush_pending_writes(force=True)
+    if _pending:
+        logger.warning('Lost %d queued session writes at exit', len(_pending))
+
+
+def purge_expired(batch_size=1000, pause=0, progress=None):
+    """Delete expired sessions in batches; return how many were deleted
+
+    Small batches keep each DELETE's write lock short, and ``pause`` seconds
+    between them let requests write in the meantime.
+    """
+    model = SessionStore.get_model_class()
+    deleted = 0
+    while True:
+        keys = list(model.objects.filter(expire_date__lt=timezone.now())
+                    .values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(pk__in=keys).delete()[0]
+        if progress:
+            progress(deleted)
+        if len(keys) < batch_size:
+            return deleted
+        time.sleep(pause)
+
+
+class SessionStore(cached_db.SessionStore):
+    @property
+    def cache_key_prefix(self):
+        # The two modes cache different values, so keep them apart
+        return KEY_PREFIX if settings.SESSION_WRITE_BEHIND else cached_db.KEY_PREFIX
+
+    def stamp_key(self, session_key):
+        return f'{self.cache_key_prefix}{session_key}:stamp'
+
+    def load(self):
+        if not settings.SESSION_WRITE_BEHIND:
+            return super().load()
+        try:
+            stamp = self._cache.get(self.stamp_key(self.session_key))
+            entry = _local.get(self.cache_key, stamp) if stamp else None
+            if entry is None and stamp:
+                entry = self._cache.get(self.cache_key)
+        except Exception:
+            # Some backends raise on invalid keys; start afresh, as cached_db does
+            entry = None
+        if entry is not None and entry[0] == stamp and entry[1] > time.time():
+            _local.put(self.cache_key, entry)
+            return copy.deepcopy(entry[2])
+
+        with _pending_lock:
+            session = _pending.get(self.session_key)
+        if session is None or session.expire_date <= timezone.now():
+            session = self._get_session_from_db()
+        if session is None:
+            return {}
+        data = self.decode(session.session_data)
+        self._store(data, self.get_expiry_age(expiry=session.expire_date))
+        return data
+
+    def save(self, must_create=False):
+        if not settings.SESSION_WRITE_BEHIND:
+            return super().save(must_create)
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if must_create:
+            # The row is written now: the INSERT is what guarantees a unique key
+            DBStore.save(self, must_create=True)
+        else:
+            # Queued writes can't notice a missing row, so check that a
+            # logout elsewhere hasn't deleted the session meanwhile.
+            if (self._cache.get(self.stamp_key(self.session_key)) is None
+                    and not DBStore.exists(self, self.session_key)):
+                raise UpdateError
+            with _pending_lock:
+                _pending[self.session_key] = self.create_model_instance(data)
+        self._store(data, self.get_expiry_age())
+
+    def _store(self, data, expiry_age):
+        entry = (uuid.uuid4().hex, time.time() + expiry_age, data)
+        self._cache.set_many({self.cache_key: entry, self.stamp_key(self.session_key): entry[0]}, expiry_age)
+        _local.put(self.cache_key, (*entry[:2], copy.deepcopy(data)))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        with _pending_lock:
+            _pending.pop(session_key, None)
+        super().delete(session_key)
+        self._cache.delete(self.stamp_key(session_key))
+        _local.discard(self.cache_key_prefix + session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        purge_expired()
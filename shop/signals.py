@@ -0,0 +1,70 @@
+"""Cache invalidation hooks for catalog models, and the session write-behind"""
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import images, search, sessions
+from .autocomplete import AUTOCOMPLETE_NAMESPACE
+from .caching import bump_version
+from .categories import CATEGORY_NAMESPACE, refresh_product_counts
+from .conditional import invalidate_catalog
+from .models import Category, Product
+from .rankings import invalidate_rankings
+
+
+# Registered first so a cleared digest is stored before the caches are
+# invalidated; new images are rendered after commit (see shop.images)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+def resize_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.update_image_digest(instance)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, **kwargs):
+    bump_version(CATEGORY_NAMESPACE)
+    bump_version(AUTOCOMPLETE_NAMESPACE)
+    invalidate_rankings()
+    invalidate_catalog()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_caches(sender, **kwargs):
+    bump_version(AUTOCOMPLETE_NAMESPACE)
+    invalidate_rankings()
+    invalidate_catalog()
+
+
+# Pages and cached lists embed the digest; names are unchanged, so the
+# autocomplete index is left alone
+@receiver(images.digest_changed)
+def invalidate_image_caches(sender, **kwargs):
+    if sender is Category:
+        bump_version(CATEGORY_NAMESPACE)
+    invalidate_rankings()
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def update_category_counts(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_product_counts({instance.category_id, getattr(instance, '_loaded_category_id', None)})
+        instance._loaded_category_id = instance.category_id
+
+
+# After the response is sent, so the write-behind never delays a page
+@receiver(request_finished)
+def flush_session_writes(sender, **kwargs):
+    sessions.flush_pending_writes()
@@ -0,0 +1,33 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from shop.images import PRESETS, derivative_url
+
+register = template.Library()
+
+PLACEHOLDER = 'img/placeholder.svg'
+
+
+@register.simple_tag
+def responsive_image(obj, preset, alt='', css_class='', loading='lazy'):
+    """Render ``obj.image`` as a <picture> offering WebP and JPEG at the preset's widths
+
+    Falls back to the original upload until its copies have been rendered,
+    and to a local placeholder when there is no image at all.
+    """
+    if not obj.image:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="{}">',
+                           static(PLACEHOLDER), alt, css_class, loading)
+    if not obj.image_digest:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+                           obj.image.url, alt, css_class, loading)
+    widths, sizes = PRESETS[preset]
+    webp = ', '.join(f'{derivative_url(obj.image_digest, width, "webp")} {width}w' for width in widths)
+    jpeg = ', '.join(f'{derivative_url(obj.image_digest, width, "jpg")} {width}w' for width in widths)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}" decoding="async"></picture>',
+        webp, sizes, derivative_url(obj.image_digest, widths[0], 'jpg'), jpeg, sizes,
+        alt, css_class, loading,
+    )
@@ -1,3 +1,1573 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts import urls as accounts_urls
+
+from . import assets, autocomplete, images, order_numbers, sessions, views
+from .backends.sqlite3.base import DatabaseWrapper, write_lock
+from . import urls as shop_urls
+from .cart import ANONYMOUS_CART_MAX_LINES, CART_COOKIE, CART_COOKIE_SALT, get_cart_count
+from .images import FORMATS, WIDTHS, derivative_name
+from .instrumentation import get_query_budget
+from .models import (Cart, CartItem, Category, Order, OrderItem, OutboundEmail, Product,
+                     ProductRanking, ProductRecommendation)
+from .order_numbers import BLOCK_SIZE, OrderNumberAllocator, encode, permute, reserve_block
+from .orders import OutOfStock, cancel_order, place_order
+from .outbox import enqueue_email
+from .pagination import decode_cursor
+from .payments import FakeGateway
+from .rankings import rebuild_rankings
+from .search import search_products
+from .sessions import SessionStore
+from .recommendations import CHUNK_SIZE, build_recommendations
+from .routers import PIN_COOKIE, ReplicaPinMiddleware, primary
+
+
+def encode_raw_cursor(raw):
+    """A pagination cursor for ``raw``, as a client could craft one"""
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+class ShopTestCase(TestCase):
+    """Shared fixtures: one category, a few products and a logged-in user"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret-pass-123')
+        cls.category = Category.objects.create(name='Electronics')
+        cls.products = [
+            Product.objects.create(
+                category=cls.category,
+                name=f'Gadget {i}',
+                description='A useful gadget',
+                price=Decimal('100.00') * (i + 1),
+                stock_quantity=10,
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+
+def set_anonymous_cart(client, lines):
+    """Give ``client`` a cookie cart of {product_id: quantity}"""
+    value = '.'.join(f'{product_id}-{quantity}' for product_id, quantity in lines.items())
+    client.cookies[CART_COOKIE] = signing.get_cookie_signer(salt=CART_COOKIE + CART_COOKIE_SALT).sign(value)
+
+
+class CartSummaryTests(ShopTestCase):
+    def fill_cart(self, quantities):
+        cart = Cart.objects.create(user=self.user)
+        for product, quantity in zip(self.products, quantities):
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        return cart
+
+    def test_summary_is_one_query_and_memoized(self):
+        cart = self.fill_cart([1, 2, 1])
+        with self.assertNumQueries(1):
+            summary = cart.summary
+            self.assertEqual(cart.total_items, 4)
+            self.assertEqual(cart.subtotal, Decimal('800.00'))
+        self.assertEqual(summary.shipping, Decimal('50'))
+        self.assertEqual(summary.total, Decimal('850.00'))
+
+    def test_free_shipping_over_threshold(self):
+        cart = self.fill_cart([5, 5])
+        self.assertEqual(cart.summary.shipping, 0)
+        self.assertEqual(cart.summary.total, Decimal('1500.00'))
+
+    def test_with_totals_annotation_matches_summary(self):
+        cart = self.fill_cart([3, 1, 2])
+        annotated = Cart.objects.with_totals().get(pk=cart.pk)
+        self.assertEqual(annotated.item_count, cart.summary.total_items)
+        self.assertEqual(annotated.subtotal_amount, cart.summary.subtotal)
+
+    def test_cart_page_renders_totals(self):
+        self.fill_cart([1, 1])
+        response = self.client.get(reverse('shop:cart'))
+        self.assertContains(response, '₹300.00')
+        self.assertContains(response, '₹350.00')
+
+
+class CartCountCacheTests(ShopTestCase):
+    def test_cart_views_write_count_through(self):
+        product = self.products[0]
+        self.client.post(reverse('shop:add_to_cart', args=[product.id]), {'quantity': 2})
+        self.assertEqual(get_cart_count(self.user), 2)
+
+        item = CartItem.objects.get(cart__user=self.user, product=product)
+        self.client.post(reverse('shop:update_cart', args=[item.id]), {'quantity': 5})
+        self.assertEqual(get_cart_count(self.user), 5)
+
+        self.client.post(reverse('shop:remove_from_cart', args=[item.id]))
+        self.assertEqual(get_cart_count(self.user), 0)
+
+    def test_badge_makes_no_cart_queries_when_warm(self):
+        self.client.post(reverse('shop:add_to_cart', args=[self.products[0].id]), {'quantity': 3})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('shop:home'))
+        self.assertContains(response, '<span class="cart-badge">3</span>', html=True)
+        self.assertFalse([q for q in ctx.captured_queries if 'shop_cart' in q['sql']])
+
+
+class AnonymousCartTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.logout()
+
+    def assertNoWrites(self, ctx):
+        self.assertEqual([q['sql'] for q in ctx.captured_queries
+                          if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))], [])
+
+    def test_cart_is_kept_without_database_writes(self):
+        product, other = self.products[:2]
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('shop:add_to_cart', args=[product.id]), {'quantity': 2})
+            self.client.post(reverse('shop:add_to_cart', args=[other.id]), {'quantity': 1})
+            self.client.post(reverse('shop:update_cart', args=[product.id]), {'quantity': 3})
+            self.client.post(reverse('shop:remove_from_cart', args=[other.id]))
+            response = self.client.get(reverse('shop:cart'))
+        self.assertNoWrites(ctx)
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual([(item.product, item.quantity) for item in response.context['cart_items']],
+                         [(product, 3)])
+        self.assertContains(response, '₹350.00')  # 3 x 100 + shipping
+        self.assertContains(response, '<span class="cart-badge">3</span>', html=True)
+
+    def test_items_outside_the_cart_are_not_found(self):
+        set_anonymous_cart(self.client, {self.products[0].id: 1})
+        response = self.client.post(reverse('shop:update_cart', args=[self.products[1].id]), {'quantity': 2})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.cookies[CART_COOKIE] = f'{self.products[0].id}-5:forged'
+        response = self.client.get(reverse('shop:cart'))
+        self.assertContains(response, 'Your cart is empty')
+
+    def test_invalid_quantities_are_rejected(self):
+        product = self.products[0]
+        set_anonymous_cart(self.client, {product.id: 5})
+        for quantity in ('-1', '0', 'two', '1.5'):
+            response = self.client.post(reverse('shop:add_to_cart', args=[product.id]), {'quantity': quantity})
+            self.assertRedirects(response, reverse('shop:product_detail', args=[product.slug]),
+                                 fetch_redirect_response=False)
+            response = self.client.post(reverse('shop:update_cart', args=[product.id]), {'quantity': quantity})
+            self.assertRedirects(response, reverse('shop:cart'), fetch_redirect_response=False)
+        response = self.client.get(reverse('shop:cart'))
+        self.assertEqual([(item.product, item.quantity) for item in response.context['cart_items']],
+                         [(product, 5)])
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('shop:add_to_cart', args=[product.id]), {'quantity': '-1'})
+        self.assertRedirects(response, reverse('shop:product_detail', args=[product.slug]),
+                             fetch_redirect_response=False)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_quantity_is_capped_at_stock(self):
+        product = self.products[0]
+        for _ in range(2):
+            self.client.post(reverse('shop:add_to_cart', args=[product.id]), {'quantity': 6})
+        response = self.client.get(reverse('shop:cart'))
+        self.assertEqual([(item.product, item.quantity) for item in response.context['cart_items']],
+                         [(product, product.stock_quantity)])
+
+    def test_cart_size_is_capped(self):
+        set_anonymous_cart(self.client, {10000 + i: 1 for i in range(ANONYMOUS_CART_MAX_LINES)})
+        response = self.client.post(reverse('shop:add_to_cart', args=[self.products[0].id]))
+        self.assertRedirects(response, reverse('shop:product_detail', args=[self.products[0].slug]))
+        self.assertNotIn(CART_COOKIE, response.cookies)
+
+    def test_login_merges_into_the_saved_cart(self):
+        first, second, third = self.products
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=first, quantity=2)
+        third.stock_quantity = 0
+        third.save()
+        set_anonymous_cart(self.client, {first.id: 9, second.id: 1, third.id: 1})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('accounts:login'),
+                                        {'username': 'buyer', 'password': 'secret-pass-123'})
+        upserts = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "shop_cartitem"')]
+        self.assertEqual(len(upserts), 1)
+        self.assertIn('ON CONFLICT', upserts[0])
+        # Capped at the stock available; out-of-stock lines are dropped
+        self.assertEqual(dict(CartItem.objects.values_list('product_id', 'quantity')),
+                         {first.id: 10, second.id: 1})
+        self.assertEqual(get_cart_count(self.user), 11)
+        self.assertEqual(response.cookies[CART_COOKIE].value, '')
+        self.assertIn(f'Out of stock and removed from your cart: {third.name}.',
+                      [str(m) for m in response.wsgi_request._messages])
+
+    def test_failed_merge_keeps_the_login_and_retries_later(self):
+        set_anonymous_cart(self.client, {self.products[0].id: 2})
+        # Recovering costs more queries than the views' budgets allow for
+        self.enterContext(self.assertLogs('shop.requests'))
+        with mock.patch.object(CartItem.objects, 'bulk_create', side_effect=OperationalError('locked')), \
+                self.assertLogs('shop.cart', 'ERROR'):
+            response = self.client.post(reverse('accounts:login'),
+                                        {'username': 'buyer', 'password': 'secret-pass-123'})
+        self.assertRedirects(response, reverse('shop:home'), fetch_redirect_response=False)
+        self.assertNotIn(CART_COOKIE, response.cookies)
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.get(reverse('shop:cart'))
+        self.assertEqual([(item.product, item.quantity) for item in response.context['cart_items']],
+                         [(self.products[0], 2)])
+        self.assertEqual(response.cookies[CART_COOKIE].value, '')
+
+    async def test_cart_is_kept_under_asgi(self):
+        response = await self.async_client.post(reverse('shop:add_to_cart', args=[self.products[0].id]))
+        self.assertIn(CART_COOKIE, response.cookies)
+
+    def test_checkout_still_needs_login(self):
+        set_anonymous_cart(self.client, {self.products[0].id: 1})
+        response = self.client.get(reverse('shop:checkout'))
+        self.assertRedirects(response, f"{reverse('accounts:login')}?next={reverse('shop:checkout')}",
+                             fetch_redirect_response=False)
+
+
+class CategoryNavigationTests(ShopTestCase):
+    def category_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q for q in ctx.captured_queries if 'FROM "shop_category"' in q['sql']]
+
+    def test_warm_pages_make_no_category_queries(self):
+        self.client.get(reverse('shop:home'))
+        self.assertEqual(self.category_queries(reverse('shop:home')), [])
+        self.assertEqual(self.category_queries(reverse('accounts:profile')), [])
+        self.assertEqual(
+            self.category_queries(reverse('shop:category_products', args=[self.category.slug])), [])
+
+    def test_category_save_invalidates_navigation(self):
+        self.client.get(reverse('shop:home'))
+        Category.objects.create(name='Fashion')
+        response = self.client.get(reverse('shop:home'))
+        self.assertContains(response, 'Fashion')
+
+
+class ProductSearchTests(ShopTestCase):
+    def search(self, query, **params):
+        return self.client.get(reverse('shop:search'), {'q': query, **params})
+
+    def test_prefix_and_multi_term_queries(self):
+        Product.objects.create(category=self.category, name='Wireless Earbuds',
+                               description='Noise cancelling', price=10)
+        response = self.search('wire earb')
+        self.assertEqual([p.name for p in response.context['products']], ['Wireless Earbuds'])
+        self.assertEqual(self.search('wire gadget').context['products'], [])
+
+    def test_name_hits_rank_above_description_hits(self):
+        Product.objects.create(category=self.category, name='Speaker',
+                               description='Pairs with any phone', price=10)
+        Product.objects.create(category=self.category, name='Phone Stand',
+                               description='Aluminium stand', price=10)
+        names = [p.name for p in self.search('phone').context['products']]
+        self.assertEqual(names, ['Phone Stand', 'Speaker'])
+
+    def test_index_follows_product_changes(self):
+        product = self.products[0]
+        product.name = 'Renamed Widget'
+        product.save()
+        self.assertEqual(len(self.search('widget').context['products']), 1)
+        product.is_active = False
+        product.save()
+        self.assertEqual(self.search('widget').context['products'], [])
+        product.delete()
+        self.assertEqual(self.search('widget').context['products'], [])
+
+    def test_results_are_paginated(self):
+        for i in range(25):
+            Product.objects.create(category=self.category, name=f'Lamp {i}',
+                                   description='Desk lamp', price=10)
+        response = self.search('lamp', page=2)
+        self.assertEqual(response.context['page_obj'].paginator.count, 25)
+        self.assertEqual(len(response.context['products']), 5)
+
+    def test_rebuild_command_restores_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM shop_product_fts')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search('gadget').context['products']), 3)
+
+    def test_operators_in_query_are_treated_as_text(self):
+        self.assertEqual(self.search('"gadget OR -*').status_code, 200)
+
+
+class AutocompleteTests(ShopTestCase):
+    def suggest(self, query):
+        response = self.client.get(reverse('shop:search_suggestions'), {'q': query})
+        return [item['label'] for item in response.json()['suggestions']]
+
+    def test_prefix_matches_any_word_without_queries(self):
+        Product.objects.create(category=self.category, name='Gaming Mouse RGB',
+                               description='Mouse', price=10)
+        self.suggest('warm up')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('mou'), ['Gaming Mouse RGB'])
+            self.assertEqual(self.suggest('gam rg'), ['Gaming Mouse RGB'])
+            self.assertEqual(self.suggest('rgb keyboard'), [])
+
+    def test_categories_rank_first_and_changes_refresh_index(self):
+        self.assertEqual(self.suggest('ele'), ['Electronics'])
+        Product.objects.create(category=self.category, name='Electric Kettle',
+                               description='Kettle', price=10)
+        self.assertEqual(self.suggest('ele'), ['Electronics', 'Electric Kettle'])
+        self.category.is_active = False
+        self.category.save()
+        self.assertEqual(self.suggest('ele'), [])
+
+
+class AutocompleteRebuildTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Kitchen')
+        autocomplete.get_index()
+        self.wait_for_rebuild()
+
+    def wait_for_rebuild(self):
+        thread = autocomplete._state['rebuild']
+        if thread is not None:
+            thread.join()
+
+    def labels(self, query):
+        return [item['label'] for item in autocomplete.suggest(query)]
+
+    def test_previous_index_is_served_while_rebuilding(self):
+        Product.objects.create(category=self.category, name='Electric Kettle', description='Kettle', price=10)
+        release = threading.Event()
+        build_index = autocomplete.build_index
+
+        def slow_build():
+            release.wait(5)
+            return build_index()
+
+        with mock.patch.object(autocomplete, 'build_index', side_effect=slow_build) as build:
+            with self.assertNumQueries(0):
+                self.assertEqual(self.labels('ket'), [])
+                self.assertEqual(self.labels('ket'), [])
+            release.set()
+            self.wait_for_rebuild()
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(self.labels('ket'), ['Electric Kettle'])
+
+    def test_failed_rebuild_keeps_the_index_and_retries(self):
+        Product.objects.create(category=self.category, name='Electric Kettle', description='Kettle', price=10)
+        with mock.patch.object(autocomplete, 'build_index', side_effect=OperationalError('locked')), \
+                self.assertLogs('shop.autocomplete', 'ERROR'):
+            self.assertEqual(self.labels('kit'), ['Kitchen'])
+            self.wait_for_rebuild()
+        self.assertEqual(self.labels('ket'), [])
+        self.wait_for_rebuild()
+        self.assertEqual(self.labels('ket'), ['Electric Kettle'])
+
+
+DELIVERY = {
+    'delivery_name': 'Test Buyer',
+    'delivery_phone': '9999999999',
+    'delivery_address': '1 Main Street',
+    'delivery_city': 'Delhi',
+    'delivery_state': 'Delhi',
+    'delivery_postal_code': '110001',
+}
+
+
+class PlaceOrderTests(ShopTestCase):
+    def cart_items(self, quantities):
+        cart = Cart.objects.create(user=self.user)
+        for product, quantity in zip(self.products, quantities):
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        return list(cart.items.select_related('product'))
+
+    def test_places_order_and_reserves_stock(self):
+        order = place_order(self.user, self.cart_items([2, 1]), DELIVERY)
+        self.assertEqual(order.total_amount, Decimal('450.00'))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products[:2]])
+                 .order_by('price').values_list('stock_quantity', flat=True)),
+            [8, 9],
+        )
+
+    def test_oversell_rolls_back_everything(self):
+        items = self.cart_items([1, 11])
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user, items, DELIVERY)
+        self.assertEqual(ctx.exception.product, self.products[1])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 10)
+
+    def test_cancel_releases_stock(self):
+        order = place_order(self.user, self.cart_items([4]), DELIVERY)
+        cancel_order(order)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 10)
+        self.assertEqual(Order.objects.get().status, 'cancelled')
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Many buyers racing for the last units of one product"""
+    buyers = 16
+    stock = 5
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Hot Deals')
+        self.product = Product.objects.create(
+            category=category, name='Hot Item', description='Limited',
+            price=Decimal('10.00'), stock_quantity=self.stock,
+        )
+        self.users = [
+            User.objects.create_user(f'racer{i}', f'racer{i}@example.com', 'x')
+            for i in range(self.buyers)
+        ]
+        for user in self.users:
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+
+    def checkout(self, user, barrier, results):
+        items = list(CartItem.objects.filter(cart__user=user).select_related('product'))
+        barrier.wait()
+        try:
+            for _ in range(200):
+                try:
+                    place_order(user, items, DELIVERY)
+                    results.append('ok')
+                    return
+                except OutOfStock:
+                    results.append('out')
+                    return
+                except OperationalError:
+                    # SQLite refuses a concurrent writer outright; try again.
+                    time.sleep(0.005)
+            results.append('gave up')
+        finally:
+            connection.close()
+
+    def test_parallel_checkouts_never_oversell(self):
+        barrier = threading.Barrier(self.buyers)
+        results = []
+        threads = [
+            threading.Thread(target=self.checkout, args=(user, barrier, results))
+            for user in self.users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count('ok'), self.stock)
+        self.assertEqual(results.count('out'), self.buyers - self.stock)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 0)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(OrderItem.objects.count(), self.stock)
+
+    def test_checkout_after_a_flush_skips_the_stale_block(self):
+        self.test_parallel_checkouts_never_oversell()
+        # What TransactionTestCase does between tests: the sequence row goes too
+        call_command('flush', interactive=False, verbosity=0)
+        self.setUp()
+        # generate_data then numbers its orders from the restarted sequence
+        start, stop = reserve_block(BLOCK_SIZE)
+        Order.objects.bulk_create([
+            Order(user=self.users[0], order_number=encode(permute(n)), total_amount=Decimal('10.00'), **DELIVERY)
+            for n in range(start, stop)
+        ])
+        order = place_order(self.users[1], list(CartItem.objects.filter(cart__user=self.users[1])), DELIVERY)
+        self.assertEqual(Order.objects.filter(order_number=order.order_number).count(), 1)
+
+
+class FakeGatewayTests(TestCase):
+    def test_concurrent_charges_overlap(self):
+        gateway = FakeGateway(latency=0.1)
+
+        async def charge_many():
+            return await asyncio.gather(*(
+                gateway.acharge(1000, 'inr', 'tok_visa', 'test') for _ in range(20)))
+
+        started = time.monotonic()
+        payment_ids = asyncio.run(charge_many())
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(len(set(payment_ids)), 20)
+
+
+@override_settings(PAYMENT_GATEWAY={'BACKEND': 'shop.payments.FakeGateway'})
+class CheckoutViewTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=2)
+
+    def test_get_renders_summary(self):
+        response = self.client.get(reverse('shop:checkout'))
+        self.assertContains(response, '₹250.00')
+
+    def test_successful_payment_completes_order(self):
+        response = self.client.post(reverse('shop:checkout'), {**DELIVERY, 'stripeToken': 'tok_visa'})
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('shop:order_confirmation', args=[order.id]))
+        self.assertEqual(order.payment_status, 'completed')
+        self.assertTrue(order.stripe_payment_id.startswith('fake_'))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(get_cart_count(self.user), 0)
+        self.assertEqual(OutboundEmail.objects.get().order, order)
+        self.assertEqual(mail.outbox, [])
+
+    def test_declined_payment_releases_stock(self):
+        response = self.client.post(reverse('shop:checkout'),
+                                    {**DELIVERY, 'stripeToken': 'tok_chargeDeclined'})
+        self.assertRedirects(response, reverse('shop:checkout'))
+        self.assertEqual(Order.objects.get().status, 'cancelled')
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 10)
+        self.assertTrue(CartItem.objects.exists())
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def assertOrderCancelled(self):
+        self.assertEqual(Order.objects.get().status, 'cancelled')
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, 10)
+        self.assertTrue(CartItem.objects.exists())
+
+    def test_gateway_errors_release_stock(self):
+        with mock.patch.object(FakeGateway, 'acharge', side_effect=ConnectionError('gateway down')), \
+                self.assertLogs('shop.views', 'ERROR'):
+            response = self.client.post(reverse('shop:checkout'), {**DELIVERY, 'stripeToken': 'tok_visa'})
+        self.assertRedirects(response, reverse('shop:checkout'))
+        self.assertOrderCancelled()
+        self.assertNotContains(self.client.get(reverse('shop:checkout')), 'gateway down')
+
+    def test_failure_after_payment_releases_stock(self):
+        with mock.patch('shop.views.complete_order', side_effect=DatabaseError('disk I/O error')), \
+                self.assertLogs('shop.views', 'ERROR') as logs:
+            response = self.client.post(reverse('shop:checkout'), {**DELIVERY, 'stripeToken': 'tok_visa'})
+        self.assertRedirects(response, reverse('shop:checkout'))
+        self.assertOrderCancelled()
+        self.assertIn('needs refunding', logs.output[0])
+        self.assertNotContains(self.client.get(reverse('shop:checkout')), 'disk I/O error')
+
+    def test_anonymous_user_is_sent_to_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('shop:checkout'))
+        self.assertRedirects(response, f"{reverse('accounts:login')}?next={reverse('shop:checkout')}",
+                             fetch_redirect_response=False)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('SMTP server unavailable')
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        enqueue_email('Hello', 'Body', ['a@example.com'])
+        enqueue_email('Again', 'Body', ['b@example.com'])
+
+    def test_worker_sends_queued_email(self):
+        call_command('send_queued_email', stdout=StringIO())
+        self.assertEqual([m.subject for m in mail.outbox], ['Hello', 'Again'])
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 2)
+
+    @override_settings(EMAIL_BACKEND='shop.tests.FailingEmailBackend')
+    def test_failures_back_off_then_give_up(self):
+        call_command('send_queued_email', stdout=StringIO())
+        email = OutboundEmail.objects.get(subject='Hello')
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertGreater(email.next_attempt_at, email.created_at)
+        self.assertIn('unavailable', email.last_error)
+
+        OutboundEmail.objects.update(next_attempt_at=email.created_at)
+        call_command('send_queued_email', '--max-attempts=2', stdout=StringIO())
+        self.assertEqual(OutboundEmail.objects.filter(status='failed').count(), 2)
+
+
+    def test_emails_without_recipients_fail(self):
+        enqueue_email('Nobody', 'Body', [''])
+        enqueue_email('Blank', 'Body', [' '])
+        call_command('send_queued_email', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(set(OutboundEmail.objects.filter(status='failed').values_list('subject', 'last_error')),
+                         {('Nobody', 'No recipients'), ('Blank', 'No recipients')})
+
+    def test_loop_waits_out_mail_server_outages(self):
+        connection = mail.get_connection()
+        with mock.patch('shop.management.commands.send_queued_email.get_connection', return_value=connection), \
+                mock.patch.object(connection, 'open', side_effect=[ConnectionRefusedError('down'), None]), \
+                mock.patch('time.sleep', side_effect=[None, KeyboardInterrupt]) as sleep, \
+                self.assertLogs('shop.management.commands.send_queued_email', 'WARNING'):
+            call_command('send_queued_email', '--loop', '--interval=2', stdout=StringIO())
+        self.assertEqual(sleep.call_args_list, [mock.call(2), mock.call(2)])
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_single_run_reports_mail_server_outages(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open',
+                        side_effect=ConnectionRefusedError('down')), \
+                self.assertRaisesMessage(CommandError, 'Could not connect to the mail server: down'):
+            call_command('send_queued_email', stdout=StringIO())
+
+
+class OrderNumberTests(TestCase):
+    def test_permutation_is_collision_free(self):
+        values = range(0, 1 << 40, (1 << 40) // 5000)
+        self.assertEqual(len({permute(value) for value in values}), len(values))
+
+    def test_numbers_are_unique_and_short(self):
+        allocator = OrderNumberAllocator(block_size=10)
+        numbers = [allocator.allocate() for _ in range(50)]
+        self.assertEqual(len(set(numbers)), 50)
+        self.assertTrue(all(len(n) == 11 and n.startswith('SS-') for n in numbers))
+
+    def test_numbers_never_match_the_legacy_format(self):
+        # Before these codes, orders were numbered 'SS' plus eight random
+        # digits; codes can be all digits too
+        number = encode(0)
+        self.assertEqual(number, 'SS-00000000')
+        self.assertNotRegex(number, r'^SS\d{8}$')
+
+    def test_orders_get_numbers_without_lookup_queries(self):
+        user = User.objects.create_user('numbered')
+        order = Order(user=user, total_amount=1, **DELIVERY)
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+        self.assertFalse([q for q in ctx.captured_queries
+                          if 'SELECT' in q['sql'] and 'shop_order"' in q['sql']])
+        self.assertTrue(order.order_number.startswith('SS-'))
+
+
+class OrderHistoryTests(ShopTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(45):
+            order = Order.objects.create(user=cls.user, total_amount=i, **DELIVERY)
+            OrderItem.objects.create(order=order, product=cls.products[0], quantity=1, price_snapshot=1)
+            OrderItem.objects.create(order=order, product=cls.products[1], quantity=1, price_snapshot=1)
+        # Several orders share a timestamp so the id tiebreaker matters.
+        for order in Order.objects.all():
+            Order.objects.filter(pk=order.pk).update(
+                created_at=order.created_at.replace(microsecond=0, second=order.pk // 3 % 60))
+
+    def history(self, **params):
+        return self.client.get(reverse('shop:order_history'), params)
+
+    def test_walks_all_pages_in_both_directions(self):
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        seen, pages = [], []
+        response = self.history()
+        while True:
+            page = response.context['page']
+            pages.append(page)
+            seen.extend(order.id for order in page)
+            if not page.has_next:
+                break
+            response = self.history(after=page.next_cursor)
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+
+        back = self.history(before=pages[2].previous_cursor).context['page']
+        self.assertEqual([order.id for order in back], [order.id for order in pages[1]])
+        self.assertTrue(back.has_previous)
+
+    def test_item_counts_come_from_the_main_query(self):
+        response = self.history()
+        self.assertContains(response, '2 items')
+        with CaptureQueriesContext(connection) as ctx:
+            self.history()
+        self.assertEqual(len([q for q in ctx.captured_queries if 'shop_orderitem' in q['sql']]), 1)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        self.assertEqual(len(self.history(after='not-a-cursor').context['page']), 20)
+
+    def test_crafted_cursors_fall_back_to_first_page(self):
+        for raw in [f'{timezone.now().isoformat()}|{2 ** 64}', f'{timezone.now().isoformat()}|-{2 ** 70}',
+                    '2024-01-01T00:00:00|1']:
+            for param in ['after', 'before']:
+                with self.subTest(raw=raw, param=param):
+                    response = self.history(**{param: encode_raw_cursor(raw)})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.context['page']), 20)
+
+
+class OrderSnapshotTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=2)
+        CartItem.objects.create(cart=cart, product=self.products[2], quantity=1)
+        self.order = place_order(self.user, cart.items.select_related('product'), DELIVERY)
+
+    def test_snapshot_freezes_lines_and_totals(self):
+        snapshot = Order.objects.get().snapshot
+        self.assertEqual(
+            [(line['name'], line['quantity'], line['total']) for line in snapshot['lines']],
+            [('Gadget 0', 2, '200.00'), ('Gadget 2', 1, '300.00')],
+        )
+        self.assertEqual((snapshot['shipping'], snapshot['total']), ('50', '550.00'))
+
+    def test_detail_renders_from_one_order_read(self):
+        Product.objects.filter(pk=self.products[0].pk).update(name='Renamed')
+        url = reverse('shop:order_detail', args=[self.order.id])
+        self.client.get(url)  # warm the navigation and cart badge caches
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertContains(response, 'Gadget 0')
+        self.assertContains(response, '₹200.00')
+        shop_queries = [q for q in ctx.captured_queries if '"shop_' in q['sql']]
+        self.assertEqual(len(shop_queries), 1)
+
+
+class CategoryListingTests(ShopTestCase):
+    def listing(self, **params):
+        return self.client.get(
+            reverse('shop:category_products', args=[self.category.slug]), params)
+
+    def test_active_product_count_follows_product_changes(self):
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.active_product_count, 3)
+        other = Category.objects.create(name='Fashion')
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.category = other
+        product.save()
+        self.products[1].is_active = False
+        self.products[1].save()
+        self.category.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.category.active_product_count, other.active_product_count), (1, 1))
+
+    def test_cursor_pages_without_count_queries(self):
+        for i in range(30):
+            Product.objects.create(category=self.category, name=f'Cable {i}',
+                                   description='Cable', price=5)
+        first = self.listing()
+        self.assertContains(first, '33 products')
+        page = first.context['page_obj']
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.listing(after=page.next_cursor)
+        self.assertEqual(len(second.context['products']), 13)
+        self.assertFalse(second.context['page_obj'].has_next)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+        self.assertFalse([q for q in ctx.captured_queries if 'OFFSET' in q['sql']])
+
+
+    def test_out_of_range_cursors_fall_back_to_first_page(self):
+        for raw in [f'{timezone.now().isoformat()}|{2 ** 64}', '2024-01-01T00:00:00|1']:
+            with self.subTest(raw=raw):
+                self.assertIsNone(decode_cursor(encode_raw_cursor(raw)))
+                response = self.listing(after=encode_raw_cursor(raw))
+                self.assertEqual(len(response.context['products']), 3)
+
+
+class ConditionalCatalogTests(ShopTestCase):
+    def revalidate(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        return first['ETag']
+
+    def test_unchanged_pages_return_not_modified(self):
+        # The product form issues the CSRF cookie, which is part of the ETag
+        self.client.get(reverse('shop:product_detail', args=[self.products[0].slug]))
+        for url in [reverse('shop:home'),
+                    reverse('shop:category_products', args=[self.category.slug]),
+                    reverse('shop:product_detail', args=[self.products[0].slug])]:
+            etag = self.revalidate(url)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_catalog_and_cart_changes_invalidate(self):
+        url = reverse('shop:home')
+        etag = self.revalidate(url)
+        self.products[1].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.revalidate(url)
+        self.client.post(reverse('shop:add_to_cart', args=[self.products[0].pk]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_messages_skip_validation(self):
+        url = reverse('shop:home')
+        etag = self.revalidate(url)
+        # Rejected, so the cart is unchanged but an error message is queued
+        self.client.post(reverse('shop:add_to_cart', args=[self.products[0].pk]), {'quantity': 100})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_anonymous_crawlers_get_last_modified(self):
+        self.client.logout()
+        self.client.cookies.clear()
+        self.products[0].save()
+        url = reverse('shop:home')
+        first = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+class RankingTests(ShopTestCase):
+    def sell(self, product, quantity, days_ago=0, payment_status='completed'):
+        order = Order.objects.create(
+            user=self.user, total_amount=product.price * quantity,
+            payment_status=payment_status, **DELIVERY)
+        OrderItem.objects.create(order=order, product=product, quantity=quantity,
+                                 price_snapshot=product.price)
+        Order.objects.filter(pk=order.pk).update(
+            created_at=timezone.now() - timedelta(days=days_ago))
+
+    def test_rankings_follow_paid_sales_in_each_window(self):
+        gadget0, gadget1, gadget2 = self.products
+        self.sell(gadget0, 5, days_ago=20)
+        self.sell(gadget1, 2)
+        self.sell(gadget2, 9, payment_status='failed')
+        call_command('rank_products', stdout=StringIO())
+        week = ProductRanking.objects.filter(window='week', category=None)
+        month = ProductRanking.objects.filter(window='month', category=self.category)
+        self.assertEqual([r.product for r in week], [gadget1])
+        self.assertEqual([r.product for r in month], [gadget0, gadget1])
+        self.assertEqual(month[0].units_sold, 5)
+
+    def test_home_reads_bestsellers_without_product_queries(self):
+        self.sell(self.products[2], 3)
+        rebuild_rankings()
+        self.client.get(reverse('shop:home'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('shop:home'))
+        featured = list(response.context['featured_products'])
+        # Padded with the newest products after the one that sold
+        self.assertEqual(featured, [self.products[2], self.products[1], self.products[0]])
+        self.assertFalse([q for q in ctx.captured_queries if '"shop_' in q['sql']])
+
+    def test_category_page_lists_its_bestsellers(self):
+        self.sell(self.products[0], 1)
+        rebuild_rankings()
+        url = reverse('shop:category_products', args=[self.category.slug])
+        self.assertEqual(self.client.get(url).context['bestsellers'], [self.products[0]])
+        self.products[0].is_active = False
+        self.products[0].save()
+        self.assertEqual(self.client.get(url).context['bestsellers'], [])
+
+
+class RecommendationTests(ShopTestCase):
+    def order(self, *products, payment_status='completed'):
+        order = Order.objects.create(user=self.user, total_amount=0,
+                                     payment_status=payment_status, **DELIVERY)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, price_snapshot=product.price)
+            for product in products)
+
+    def recommended(self, product):
+        return list(ProductRecommendation.objects.filter(product=product)
+                    .values_list('recommended__name', flat=True))
+
+    def test_pairs_bought_together_are_recommended(self):
+        gadget0, gadget1, gadget2 = self.products
+        self.order(gadget0, gadget1)
+        self.order(gadget0, gadget1, gadget1)
+        self.order(gadget0, gadget2)
+        self.order(gadget1, gadget2, payment_status='failed')
+        # One order line per chunk still keeps each order together
+        for chunk_size in [1, CHUNK_SIZE]:
+            build_recommendations(min_support=2, chunk_size=chunk_size)
+            self.assertEqual(self.recommended(gadget0), ['Gadget 1'])
+            self.assertEqual(self.recommended(gadget1), ['Gadget 0'])
+            self.assertEqual(self.recommended(gadget2), [])
+        build_recommendations(min_support=1)
+        self.assertEqual(self.recommended(gadget0), ['Gadget 1', 'Gadget 2'])
+
+    def test_detail_page_serves_recommendations(self):
+        other = Product.objects.create(category=Category.objects.create(name='Books'),
+                                       name='Manual', description='Manual', price=10)
+        for _ in range(2):
+            self.order(self.products[0], other)
+        call_command('build_recommendations', stdout=StringIO())
+        url = reverse('shop:product_detail', args=[self.products[0].slug])
+        self.assertEqual(self.client.get(url).context['related_products'], [other])
+        url = reverse('shop:product_detail', args=[self.products[1].slug])
+        related = self.client.get(url).context['related_products']
+        self.assertEqual(set(related), {self.products[0], self.products[2]})
+
+
+def image_upload(size=(1200, 900)):
+    buffer = BytesIO()
+    Image.new('RGBA', size, (200, 30, 30, 128)).save(buffer, 'PNG')
+    return SimpleUploadedFile('shot.png', buffer.getvalue(), content_type='image/png')
+
+
+class ImageDerivativeTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def test_saving_renders_nothing_before_commit(self):
+        product = self.products[0]
+        product.image = image_upload()
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(default_storage.exists('derivatives'))
+
+    def test_backfill_fills_missing_digests(self):
+        self.products[0].image = image_upload(size=(100, 60))
+        self.products[0].save()
+        Product.objects.update(image_digest='')
+        call_command('build_image_derivatives', '--workers', '1', stdout=StringIO())
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertTrue(product.image_digest)
+        # Small sources are never enlarged
+        with Image.open(default_storage.path(derivative_name(product.image_digest, 1000, 'jpg'))) as copy:
+            self.assertEqual(copy.size, (100, 60))
+
+    def test_missing_images_use_local_placeholder(self):
+        html = self.client.get(reverse('shop:home')).content.decode()
+        self.assertIn('/static/img/placeholder.svg', html)
+        self.assertNotIn('via.placeholder.com', html)
+
+
+class ImageRenderTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        category = Category.objects.create(name='Electronics')
+        self.product = Product.objects.create(category=category, name='Gadget', description='A gadget',
+                                              price=Decimal('100.00'), stock_quantity=10)
+
+    def wait_for_renders(self):
+        # The executor has one thread, so this runs after every queued render
+        images._executor.submit(int).result()
+
+    def test_saving_an_image_renders_every_width(self):
+        product = self.product
+        product.image = image_upload()
+        product.save()
+        self.wait_for_renders()
+        product.refresh_from_db()
+        self.assertEqual(len(product.image_digest), 32)
+        for width in WIDTHS:
+            for ext in FORMATS:
+                with Image.open(default_storage.path(derivative_name(product.image_digest, width, ext))) as copy:
+                    self.assertEqual(copy.width, width)
+        html = self.client.get(reverse('shop:product_detail', args=[product.slug])).content.decode()
+        self.assertIn(f'{product.image_digest}-1000.webp 1000w', html)
+        self.assertIn('loading="eager"', html)
+
+    def test_late_render_of_a_replaced_image_is_discarded(self):
+        product = self.product
+        product.image = image_upload()
+        product.save()
+        self.wait_for_renders()
+        product.refresh_from_db()
+        digest = product.image_digest
+        old_name = default_storage.save('products/old.png', image_upload(size=(100, 60)))
+        images._executor.submit(images._render_and_store, Product, product.pk, old_name,
+                                default_storage.path(old_name), default_storage.location).result()
+        product.refresh_from_db()
+        self.assertEqual(product.image_digest, digest)
+
+
+class AssetServingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        static_root = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(STATIC_ROOT=static_root))
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.css = staticfiles_storage.stored_name('css/style.css')
+        with staticfiles_storage.open('css/style.css') as f:
+            cls.original = f.read()
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_fingerprinted_files_are_precompressed_and_immutable(self):
+        self.assertNotEqual(self.css, 'css/style.css')
+        response = self.client.get(f'/static/{self.css}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(gzip.decompress(self.body(response)), self.original)
+        response = self.client.get(f'/static/{self.css}', HTTP_ACCEPT_ENCODING='gzip, deflate',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(f'/static/{self.css}', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(self.body(response), self.original)
+
+    @skipUnless(assets.brotli, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        response = self.client.get(f'/static/{self.css}', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(assets.brotli.decompress(self.body(response)), self.original)
+
+    def test_range_requests(self):
+        response = self.client.get('/static/css/style.css', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.original)}')
+        self.assertEqual(self.body(response), self.original[10:20])
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response = self.client.get('/static/css/style.css', HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.body(response), self.original[-5:])
+        response = self.client.get('/static/css/style.css', HTTP_RANGE=f'bytes={len(self.original)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_media_paths_stay_inside_media_root(self):
+        self.assertEqual(self.client.get('/media/..%2Fmanage.py').status_code, 404)
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+
+
+class CatalogImportTests(ShopTestCase):
+    def feed(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_csv_import_upserts_in_chunks(self):
+        path = self.feed('feed.csv', (
+            'slug,name,category,price,stock,description\n'
+            'solar-lamp,Solar Lamp,electronics,499.50,5,Bright lamp\n'
+            'desk-fan,Desk Fan,Electronics,899,0,Quiet fan\n'
+            ',Broken,Electronics,cheap,1,\n'
+            ',Mystery,Toys,10,1,\n'
+            'solar-lamp,Solar Lamp,Electronics,450,7,Brighter lamp\n'
+            'gadget-0,Gadget 0,Electronics,150,3,Refreshed gadget\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, '--chunk-size', '2', stdout=out, stderr=err)
+        self.assertIn('Imported 4 products (2 new, 2 updated)', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertIn("Line 4: invalid price 'cheap'", err.getvalue())
+        self.assertIn("Line 5: unknown category 'Toys'", err.getvalue())
+        lamp = Product.objects.get(slug='solar-lamp')
+        self.assertEqual((lamp.price, lamp.stock_quantity), (Decimal('450.00'), 7))
+        gadget = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual((gadget.price, gadget.created_at), (Decimal('150.00'), self.products[0].created_at))
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.active_product_count, 5)
+        self.assertEqual([p.name for p in search_products('brighter')], ['Solar Lamp'])
+
+    def test_rows_without_slugs_are_always_new_products(self):
+        Product.objects.create(category=self.category, name='Lamp', slug='lamp-2', price=1)
+        path = self.feed('feed.csv', (
+            'name,category,price\n'
+            'Lamp,Electronics,10\n'
+            'Lamp,Electronics,20\n'
+            'Lamp,Electronics,30\n'
+            'Gadget 0,Electronics,150\n'
+        ))
+        out = StringIO()
+        call_command('import_catalog', path, '--chunk-size', '2', stdout=out, stderr=StringIO())
+        self.assertIn('Imported 4 products (4 new, 0 updated)', out.getvalue())
+        self.assertEqual(list(Product.objects.filter(name='Lamp', price__gte=10)
+                              .order_by('price').values_list('slug', flat=True)),
+                         ['lamp', 'lamp-3', 'lamp-4'])
+        self.assertEqual(Product.objects.get(slug='gadget-0-2').price, Decimal('150.00'))
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).price, self.products[0].price)
+
+    def test_generated_slugs_fit_the_field(self):
+        name = 'x' * 250
+        Product.objects.create(category=self.category, name=name[:200], slug='x' * 200, price=1)
+        path = self.feed('feed.jsonl', json.dumps({'name': name[:200], 'category': 'Electronics', 'price': 1}))
+        call_command('import_catalog', path, stdout=StringIO(), stderr=StringIO())
+        self.assertTrue(Product.objects.filter(slug='x' * 198 + '-2').exists())
+
+    def test_jsonl_import_can_create_categories(self):
+        path = self.feed('feed.jsonl', '\n'.join([
+            json.dumps({'name': 'Chess Set', 'category': 'Games', 'price': 999}),
+            '{not json',
+            json.dumps({'name': 'Go Board', 'category': 'Games', 'price': '1,250', 'is_active': 'no'}),
+        ]))
+        call_command('import_catalog', path, '--dry-run', '--create-categories',
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Category.objects.filter(name='Games').exists())
+        call_command('import_catalog', path, '--create-categories', stdout=StringIO(), stderr=StringIO())
+        games = Category.objects.get(name='Games')
+        self.assertEqual(games.active_product_count, 1)
+        self.assertEqual(Product.objects.get(slug='go-board').price, Decimal('1250.00'))
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'db.sqlite3')
+
+    def wrapper(self, **options):
+        databases = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {},
+            'tuned': {'ENGINE': 'shop.backends.sqlite3', 'NAME': self.path, 'OPTIONS': options},
+        })
+        wrapper = DatabaseWrapper(databases['tuned'], 'tuned')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def begin(self, wrapper):
+        wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+
+    def test_connections_use_wal_and_tuned_pragmas(self):
+        wrapper = self.wrapper(timeout=3, pragmas={'cache_size': -2000})
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 3000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -2000)
+        self.assertEqual(self.pragma(wrapper, 'foreign_keys'), 1)
+
+    def test_transactions_queue_for_the_write_lock(self):
+        first, second = self.wrapper(timeout=0.1), self.wrapper(timeout=0.1)
+        self.begin(first)
+        self.assertTrue(first.holds_write_lock)
+        with self.assertRaisesMessage(OperationalError, 'write queue'):
+            self.begin(second)
+        self.assertFalse(second.holds_write_lock)
+        first.rollback()
+        first.set_autocommit(True)
+        self.assertFalse(first.holds_write_lock)
+        self.begin(second)
+        second.commit()
+        self.assertFalse(second.holds_write_lock)
+
+    def test_lock_is_released_when_begin_fails(self):
+        wrapper = self.wrapper(timeout=0.1)
+        wrapper.ensure_connection()
+        # Another process holding SQLite's write lock
+        other = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute('BEGIN IMMEDIATE')
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            self.begin(wrapper)
+        self.assertFalse(wrapper.holds_write_lock)
+        self.assertFalse(write_lock(self.path).locked())
+        other.execute('ROLLBACK')
+        wrapper.set_autocommit(True)
+        self.begin(wrapper)
+        wrapper.commit()
+
+    def test_concurrent_writers_do_not_fail(self):
+        out = StringIO()
+        call_command('bench_sqlite', '--modes', 'stock', 'tuned', '--threads', '4', '--duration', '0.3',
+                     '--write-ratio', '0.5', '--rows', '100', stdout=out, stderr=out)
+        self.assertRegex(out.getvalue(), r'tuned: .* 0 failed reads, 0 failed writes\n')
+        self.assertNotIn('recorded', out.getvalue())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=10)
+class ReplicaRouterTests(SimpleTestCase):
+    def serve(self, method='get', cookies=None, view=None):
+        """Run ``view`` inside ReplicaPinMiddleware; return its result and the response"""
+        result = []
+
+        def get_response(request):
+            result.append(view())
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        response = ReplicaPinMiddleware(get_response)(request)
+        return result[0], response
+
+    def read(self, model=Product):
+        return router.db_for_read(model)
+
+    def test_catalog_reads_go_to_a_replica(self):
+        self.assertEqual(self.serve(view=lambda: [self.read(Product), self.read(Order), self.read(Cart)])[0],
+                         ['replica', 'replica', 'default'])
+
+    def test_reads_outside_requests_and_transactions_use_the_primary(self):
+        self.assertEqual(self.read(), 'default')
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(self.serve(view=self.read)[0], 'default')
+
+        def view():
+            with primary():
+                return self.read()
+        self.assertEqual(self.serve(view=view)[0], 'default')
+
+    def test_request_reads_its_own_writes(self):
+        def view():
+            before = self.read()
+            self.assertEqual(router.db_for_write(Product), 'default')
+            return before, self.read()
+        self.assertEqual(self.serve(view=view)[0], ('replica', 'default'))
+
+    def test_post_pins_the_browser_to_the_primary(self):
+        db, response = self.serve('post', view=self.read)
+        self.assertEqual(db, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+        self.assertEqual(self.serve(cookies={PIN_COOKIE: '1'}, view=self.read)[0], 'default')
+        self.assertNotIn(PIN_COOKIE, self.serve(view=self.read)[1].cookies)
+
+    def test_async_stack_routes_sync_views(self):
+        async def get_response(request):
+            # As Django runs a sync view under ASGI
+            response.db = await sync_to_async(self.read)()
+            return response
+
+        response = HttpResponse()
+        middleware = ReplicaPinMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertEqual(response.db, 'replica')
+        async_to_sync(middleware)(RequestFactory().post('/'))
+        self.assertEqual(response.db, 'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_nothing_is_routed(self):
+        db, response = self.serve('post', view=lambda: (self.read(), router.db_for_write(Product)))
+        self.assertEqual(db, ('default', 'default'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class SyncReplicaTests(TransactionTestCase):
+    def test_copies_the_primary_into_each_replica(self):
+        category = Category.objects.create(name='Books')
+        Product.objects.create(category=category, name='Novel', description='', price=5)
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'replica.sqlite3')
+        connections.settings['sync_target'] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {}, 'sync_target': {'ENGINE': 'shop.backends.sqlite3', 'NAME': path},
+        })['sync_target']
+        self.addCleanup(connections.settings.pop, 'sync_target')
+        self.addCleanup(connections.__delitem__, 'sync_target')
+        self.addCleanup(lambda: connections['sync_target'].close())
+        with override_settings(DATABASE_REPLICAS=['sync_target']):
+            call_command('sync_replica', stdout=StringIO())
+        self.assertEqual(list(Product.objects.using('sync_target').values_list('name', flat=True)), ['Novel'])
+
+
+@override_settings(SESSION_WRITE_BEHIND=True)
+class SessionEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        sessions._local.clear()
+        sessions._pending.clear()
+        # Queued writes must not outlive the test database
+        self.addCleanup(sessions._pending.clear)
+
+    def new_session(self, **data):
+        store = SessionStore()
+        store.update(data)
+        store.create()
+        return store
+
+    def stored_data(self, session_key):
+        return SessionStore().decode(Session.objects.get(pk=session_key).session_data)
+
+    def test_repeat_loads_skip_the_database_and_cache_payload(self):
+        key = self.new_session(cart='a').session_key
+        with self.assertNumQueries(0), mock.patch.object(SessionStore, 'decode') as decode:
+            self.assertEqual(SessionStore(key)['cart'], 'a')
+        decode.assert_not_called()
+
+    def test_changes_from_other_workers_are_seen(self):
+        key = self.new_session(cart='a').session_key
+        self.assertEqual(SessionStore(key)['cart'], 'a')
+        other = SessionStore(key)
+        other['cart'] = 'b'
+        # Another worker's save only reaches this one through the shared cache
+        with mock.patch.object(sessions._local, 'put'):
+            other.save()
+        self.assertEqual(SessionStore(key)['cart'], 'b')
+
+    def test_changes_are_written_behind_in_one_update(self):
+        stores = [self.new_session(cart=i) for i in range(3)]
+        for store in stores:
+            store['cart'] = 'changed'
+            store.save()
+        self.assertEqual(self.stored_data(stores[0].session_key), {'cart': 0})
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(sessions.flush_pending_writes(force=True), 3)
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(self.stored_data(stores[2].session_key), {'cart': 'changed'})
+
+    @override_settings(SESSION_WRITE_BEHIND_SECONDS=0)
+    def test_failed_flush_is_logged_and_retried(self):
+        store = self.new_session(cart='a')
+        store['cart'] = 'b'
+        store.save()
+        with mock.patch.object(Session.objects, 'bulk_update', side_effect=OperationalError('locked')), \
+                self.assertLogs('shop.sessions', 'WARNING'):
+            request_finished.send(sender=None)
+        self.assertIn(store.session_key, sessions._pending)
+        self.assertEqual(sessions.flush_pending_writes(force=True), 1)
+        self.assertEqual(self.stored_data(store.session_key), {'cart': 'b'})
+
+    def test_evicted_sessions_reload_from_queue_or_database(self):
+        store = self.new_session(cart='a')
+        cache.clear()
+        sessions._local.clear()
+        self.assertEqual(SessionStore(store.session_key)['cart'], 'a')
+        store['cart'] = 'b'
+        store.save()
+        cache.clear()
+        self.assertEqual(SessionStore(store.session_key)['cart'], 'b')
+
+    def test_deleted_sessions_stay_deleted(self):
+        store = self.new_session(user='1')
+        stale = SessionStore(store.session_key)
+        self.assertEqual(stale['user'], '1')
+        store['cart'] = 'b'
+        store.save()
+        store.delete()
+        self.assertEqual(sessions.flush_pending_writes(force=True), 0)
+        self.assertFalse(Session.objects.filter(pk=store.session_key).exists())
+        self.assertEqual(SessionStore(store.session_key).load(), {})
+        stale['cart'] = 'c'
+        with self.assertRaises(UpdateError):
+            stale.save()
+
+    def test_write_behind_needs_a_shared_cache(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'needs a cache shared by all processes'):
+            sessions.check_shared_cache()
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with override_settings(CACHES=redis):
+            sessions.check_shared_cache()
+        with override_settings(SESSION_WRITE_BEHIND=False):
+            sessions.check_shared_cache()
+
+    @override_settings(SESSION_WRITE_BEHIND=False)
+    def test_writes_go_through_without_write_behind(self):
+        store = self.new_session(cart='a')
+        store['cart'] = 'b'
+        store.save()
+        self.assertEqual(sessions._pending, {})
+        self.assertEqual(self.stored_data(store.session_key), {'cart': 'b'})
+        self.assertEqual(SessionStore(store.session_key)['cart'], 'b')
+
+    def test_purge_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i:03}', session_data='', expire_date=now - timedelta(days=1))
+             for i in range(25)]
+            + [Session(session_key='current', session_data='', expire_date=now + timedelta(days=1))])
+        out = StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('purge_sessions', '--batch-size', '10', '--pause', '0', stdout=out)
+        self.assertIn('Deleted 25 expired sessions', out.getvalue())
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('DELETE')]), 3)
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), ['current'])
+
+
+class LoadBenchmarkTests(TransactionTestCase):
+    def setUp(self):
+        order_numbers.allocator.reset()
+
+    def test_generated_data_drives_every_route(self):
+        call_command('generate_data', '--scale', '0.01', '--users', '4', stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 100)
+        self.assertTrue(OrderItem.objects.exists())
+        paid = Order.objects.filter(payment_status='completed').count()
+        report_path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'report.json')
+        err = StringIO()
+        # One client: the shared in-memory test database fails concurrent writes outright
+        call_command('benchmark', '--requests', '4', '--concurrency', '1', '--warmup', '1',
+                     '--output', report_path, stderr=err)
+        self.assertNotIn('No benchmark scenario', err.getvalue())
+        with open(report_path) as f:
+            report = json.load(f)
+        self.assertEqual(report['meta']['concurrency'], 1)
+        for name, result in report['routes'].items():
+            self.assertEqual((name, result['requests'], result['errors']), (name, 4, 0))
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+        self.assertEqual(report['routes']['shop:search_suggestions']['queries_per_request']['max'], 0)
+        checkout = report['routes']['shop:checkout (POST)']
+        self.assertEqual(checkout['redirects'], {'shop:order_confirmation': 4})
+        # Four timed checkouts and one warmup, each a new paid order
+        self.assertEqual(Order.objects.filter(payment_status='completed').count(), paid + 5)
+
+    def test_unexpected_responses_count_as_errors(self):
+        call_command('generate_data', '--scale', '0.01', '--users', '1', stdout=StringIO())
+        report_path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'report.json')
+        declined = {**DELIVERY, 'stripeToken': 'tok_chargeDeclined'}
+        with mock.patch('shop.management.commands.benchmark.DELIVERY', declined):
+            call_command('benchmark', '--requests', '2', '--concurrency', '1', '--warmup', '0',
+                         '--routes', 'shop:checkout (POST)', '--output', report_path, stderr=StringIO())
+        with open(report_path) as f:
+            checkout = json.load(f)['routes']['shop:checkout (POST)']
+        self.assertEqual(checkout['errors'], 2)
+        self.assertEqual(checkout['redirects'], {'shop:checkout': 2})
+
+
+@override_settings(PAYMENT_GATEWAY={'BACKEND': 'shop.payments.FakeGateway'})
+class QueryBudgetTests(ShopTestCase):
+    """Every shop and accounts view stays within its declared query budget
+
+    The fixtures hold several of everything a page lists, so a query per
+    row (an N+1) pushes the view over budget.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.products += [
+            Product.objects.create(category=cls.category, name=f'Widget {i}', description='A widget',
+                                   price=Decimal('50.00'), stock_quantity=10)
+            for i in range(3)
+        ]
+        cls.orders = []
+        for _ in range(3):
+            cart = Cart.objects.create(user=cls.user)
+            for product in cls.products[:4]:
+                CartItem.objects.create(cart=cart, product=product, quantity=1)
+            cls.orders.append(place_order(cls.user, list(cart.items.select_related('product')), DELIVERY))
+            cart.delete()
+
+    def setUp(self):
+        super().setUp()
+        self.cart = Cart.objects.create(user=self.user)
+        self.items = [CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+                      for product in self.products[:4]]
+
+    def assertWithinBudget(self, response):
+        timing = response.request_timing
+        self.assertIsNotNone(timing.budget, f'{timing.view} declares no query budget')
+        self.assertLess(response.status_code, 500)
+        self.assertLessEqual(
+            timing.queries, timing.budget,
+            f'{timing.view} ran {timing.queries} queries, over its budget of {timing.budget}; '
+            f'slowest: {timing.slowest_queries()}')
+
+    def requests(self):
+        """(client method, URL, data) for every view; each runs on fresh fixtures"""
+        order = self.orders[0]
+        delivery = {**DELIVERY, 'stripeToken': 'tok_visa'}
+        return [
+            ('get', reverse('shop:home'), {}),
+            ('get', reverse('shop:category_products', args=[self.category.slug]), {}),
+            ('get', reverse('shop:product_detail', args=[self.products[0].slug]), {}),
+            ('get', reverse('shop:search'), {'q': 'gadget'}),
+            ('get', reverse('shop:search_suggestions'), {'q': 'gad'}),
+            ('get', reverse('shop:cart'), {}),
+            ('post', reverse('shop:add_to_cart', args=[self.products[4].pk]), {'quantity': 1}),
+            ('post', reverse('shop:update_cart', args=[self.items[0].pk]), {'quantity': 2}),
+            ('post', reverse('shop:remove_from_cart', args=[self.items[0].pk]), {}),
+            ('get', reverse('shop:checkout'), {}),
+            ('post', reverse('shop:checkout'), delivery),
+            ('get', reverse('shop:order_confirmation', args=[order.pk]), {}),
+            ('get', reverse('shop:order_history'), {}),
+            ('get', reverse('shop:order_detail', args=[order.pk]), {}),
+            ('get', reverse('accounts:profile'), {}),
+            ('post', reverse('accounts:profile'), {'first_name': 'Buyer', 'email': 'buyer@example.com'}),
+            ('post', reverse('accounts:logout'), {}),
+        ]
+
+    def anonymous_requests(self):
+        return [
+            ('get', reverse('accounts:register'), {}),
+            ('post', reverse('accounts:register'), {
+                'username': 'newbie', 'email': 'newbie@example.com', 'first_name': 'New',
+                'last_name': 'User', 'phone_number': '9999999999',
+                'password1': 'secret-pass-123', 'password2': 'secret-pass-123'}),
+            ('get', reverse('accounts:login'), {}),
+            ('post', reverse('accounts:login'), {'username': 'buyer', 'password': 'secret-pass-123'}),
+            ('get', reverse('shop:cart'), {}),
+            ('post', reverse('shop:add_to_cart', args=[self.products[4].pk]), {'quantity': 1}),
+            ('post', reverse('shop:update_cart', args=[self.products[0].pk]), {'quantity': 2}),
+            ('post', reverse('shop:remove_from_cart', args=[self.products[0].pk]), {}),
+        ]
+
+    def test_every_view_declares_a_budget(self):
+        for module in (shop_urls, accounts_urls):
+            for pattern in module.urlpatterns:
+                with self.subTest(view=pattern.name):
+                    self.assertIsNotNone(get_query_budget(pattern.callback, 'GET'))
+
+    def test_views_stay_within_budget(self):
+        for logged_in, requests in [(True, self.requests()), (False, self.anonymous_requests())]:
+            for method, url, data in requests:
+                with self.subTest(method=method, url=url), transaction.atomic():
+                    cache.clear()
+                    self.client.logout()
+                    if logged_in:
+                        self.client.force_login(self.user)
+                    else:
+                        # Logging in merges this into the saved cart
+                        set_anonymous_cart(self.client, {product.pk: 1 for product in self.products})
+                    response = getattr(self.client, method)(url, data)
+                    self.assertWithinBudget(response)
+                    transaction.set_rollback(True)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('shop:cart'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertGreater(response.request_timing.template_time, 0)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('shop:cart')))
+
+    @override_settings(DEBUG=True)
+    def test_asgi_stack_is_not_adapted_to_sync(self):
+        with self.assertLogs('django.request', 'DEBUG') as logs:
+            logging.getLogger('django.request').debug('loading')
+            ASGIHandler()
+        self.assertEqual([record.getMessage() for record in logs.records], ['loading'])
+
+    async def test_async_requests_are_timed(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('shop:checkout'))
+        timing = response.request_timing
+        self.assertEqual((timing.view, timing.budget), ('shop:checkout', 7))
+        self.assertGreater(timing.queries, 0)
+        self.assertGreater(timing.template_time, 0)
+
+    def test_over_budget_requests_are_logged(self):
+        with mock.patch.dict(views.cart_view.query_budget, default=1), \
+                self.assertLogs('shop.requests', 'WARNING') as logs:
+            self.client.get(reverse('shop:cart'))
+        timing = logs.records[0].request_timing
+        self.assertEqual((timing['view'], timing['query_budget'], timing['status']), ('shop:cart', 1, 200))
+        self.assertGreater(timing['queries'], 1)
+        self.assertEqual(len(timing['slowest_queries']), 3)
+
+
+class IndexAdvisorTests(ShopTestCase):
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('index_advisor', '--fail-on-issues', stdout=out)
+        self.assertIn('No full scans or temp B-tree sorts found', out.getvalue())
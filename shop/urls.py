@@ -8,6 +8,7 @@ urlpatterns = [
     path('category/<slug:slug>/', views.CategoryProductListView.as_view(), name='category_products'),
     path('product/<slug:slug>/', views.ProductDetailView.as_view(), name='product_detail'),
     path('search/', views.search_products, name='search'),
+    path('search/suggest/', views.search_suggestions, name='search_suggestions'),
     path('cart/', views.cart_view, name='cart'),
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/update/<int:item_id>/', views.update_cart, name='update_cart'),
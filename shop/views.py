@@ -1,129 +1,230 @@
+import logging
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
+from django.http import Http404, JsonResponse
+from django.views.decorators.cache import cache_control
 from django.views.generic import ListView, DetailView
-from django.db.models import Q
-from django.core.mail import send_mail
+from django.core.paginator import Paginator
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.conf import settings
-import stripe
 
+from . import autocomplete, search
+from .cart import (CART_COOKIE, AnonymousCart, claim_anonymous_cart, get_anonymous_cart, refresh_cart_count,
+                   set_cart_count)
+from .categories import get_active_category
+from .conditional import conditional_catalog_page, conditional_catalog_view
+from .instrumentation import query_budget
 from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from .orders import OutOfStock, cancel_order, complete_order, place_order
+from .pagination import KeysetPaginator
+from .payments import PaymentError, get_gateway
+from .rankings import get_bestsellers
+
+SEARCH_RESULTS_PER_PAGE = 20
+SUGGESTIONS_LIMIT = 8
+ORDERS_PER_PAGE = 20
+FEATURED_PRODUCTS = 8
+CATEGORY_BESTSELLERS = 4
+RELATED_PRODUCTS = 4
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+logger = logging.getLogger(__name__)
 
 
+@query_budget(8)
+@conditional_catalog_page
 def home(request):
     """Homepage view"""
-    categories = Category.objects.filter(is_active=True)
-    featured_products = Product.objects.filter(is_active=True)[:8]
-    
     context = {
-        'categories': categories,
-        'featured_products': featured_products,
+        'featured_products': get_bestsellers(limit=FEATURED_PRODUCTS),
     }
     return render(request, 'shop/home.html', context)
 
 
+@query_budget(8)
+@conditional_catalog_view
 class CategoryProductListView(ListView):
-    """Product listing by category"""
+    """Product listing by category
+
+    Pages are addressed by keyset cursors rather than page numbers, so deep
+    pages cost the same as the first; the product total comes from the
+    category's maintained ``active_product_count`` instead of a COUNT(*).
+    """
     model = Product
     template_name = 'shop/product_list.html'
     context_object_name = 'products'
     paginate_by = 20
 
     def get_queryset(self):
-        self.category = get_object_or_404(Category, slug=self.kwargs['slug'])
+        self.category = (get_active_category(self.kwargs['slug'])
+                         or get_object_or_404(Category, slug=self.kwargs['slug']))
         return Product.objects.filter(category=self.category, is_active=True)
 
+    def paginate_queryset(self, queryset, page_size):
+        page = KeysetPaginator(queryset, page_size).get_page(
+            after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        return None, page, page.object_list, page.has_other_pages
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
-        context['categories'] = Category.objects.filter(is_active=True)
+        context['product_count'] = self.category.active_product_count
+        context['bestsellers'] = get_bestsellers(self.category, limit=CATEGORY_BESTSELLERS)
         return context
 
 
+@query_budget(8)
+@conditional_catalog_view
 class ProductDetailView(DetailView):
     """Product detail view"""
-    model = Product
+    queryset = Product.objects.select_related('category')
     template_name = 'shop/product_detail.html'
     context_object_name = 'product'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.filter(is_active=True)
-        # Get related products from same category
-        context['related_products'] = Product.objects.filter(
-            category=self.object.category,
-            is_active=True
-        ).exclude(id=self.object.id)[:4]
+        # Precomputed "bought together" products, else the same category
+        related_products = [
+            recommendation.recommended for recommendation in
+            self.object.recommendations.filter(recommended__is_active=True)
+            .select_related('recommended')[:RELATED_PRODUCTS]
+        ]
+        if not related_products:
+            related_products = Product.objects.filter(
+                category=self.object.category,
+                is_active=True
+            ).exclude(id=self.object.id)[:RELATED_PRODUCTS]
+        context['related_products'] = related_products
         return context
 
 
+@query_budget(8)
 def search_products(request):
     """Search products"""
     query = request.GET.get('q', '')
-    products = []
+    page_obj = None
     
     if query:
-        products = Product.objects.filter(
-            Q(name__icontains=query) | Q(description__icontains=query),
-            is_active=True
-        )
+        paginator = Paginator(search.search_products(query), SEARCH_RESULTS_PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get('page'))
     
     context = {
-        'products': products,
+        'products': page_obj.object_list if page_obj else [],
+        'page_obj': page_obj,
         'query': query,
-        'categories': Category.objects.filter(is_active=True),
     }
     return render(request, 'shop/search_results.html', context)
 
 
-@login_required
+@query_budget(3)
+@cache_control(public=True, max_age=60)
+def search_suggestions(request):
+    """Typeahead suggestions for the navbar search box"""
+    query = request.GET.get('q', '')[:100]
+    return JsonResponse({
+        'query': query,
+        'suggestions': autocomplete.suggest(query, SUGGESTIONS_LIMIT),
+    })
+
+
+@query_budget(8)
 def cart_view(request):
     """Shopping cart view"""
+    if not request.user.is_authenticated:
+        cart_items = get_anonymous_cart(request).items()
+        context = {
+            'summary': AnonymousCart.summary(cart_items),
+            'cart_items': cart_items,
+        }
+        return render(request, 'shop/cart.html', context)
+    
+    if CART_COOKIE in request.COOKIES:
+        # Left over from a login whose merge failed
+        claim_anonymous_cart(request, request.user)
     cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all()
+    cart_items = cart.items.select_related('product__category')
     
     context = {
         'cart': cart,
+        'summary': cart.summary,
         'cart_items': cart_items,
-        'categories': Category.objects.filter(is_active=True),
     }
     return render(request, 'shop/cart.html', context)
 
 
-@login_required
+def _posted_quantity(request):
+    """The POSTed quantity, or None unless it is a positive integer"""
+    try:
+        quantity = int(request.POST.get('quantity', 1))
+    except ValueError:
+        return None
+    return quantity if quantity > 0 else None
+
+
+@query_budget(11)
 def add_to_cart(request, product_id):
     """Add product to cart"""
     product = get_object_or_404(Product, id=product_id)
-    quantity = int(request.POST.get('quantity', 1))
+    quantity = _posted_quantity(request)
+    
+    if quantity is None:
+        messages.error(request, 'Invalid quantity.')
+        return redirect('shop:product_detail', slug=product.slug)
     
     if not product.in_stock or quantity > product.stock_quantity:
         messages.error(request, 'Product is out of stock or insufficient quantity.')
         return redirect('shop:product_detail', slug=product.slug)
     
+    if not request.user.is_authenticated:
+        # Logged-out carts live in a cookie until login
+        if not get_anonymous_cart(request).add(product.id, quantity, product.stock_quantity):
+            messages.error(request, 'Your cart is full. Log in to add more products.')
+            return redirect('shop:product_detail', slug=product.slug)
+        messages.success(request, f'{product.name} added to cart!')
+        return redirect('shop:cart')
+    
     cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
+    cart_item, created = CartItem.objects.get_or_create(
+        cart=cart, product=product, defaults={'quantity': quantity})
     
     if not created:
-        cart_item.quantity += quantity
-    else:
-        cart_item.quantity = quantity
-    
-    cart_item.save()
+        cart_item.quantity = min(cart_item.quantity + quantity, product.stock_quantity)
+        cart_item.save(update_fields=['quantity'])
+    refresh_cart_count(request.user)
     messages.success(request, f'{product.name} added to cart!')
     return redirect('shop:cart')
 
 
-@login_required
+@query_budget(7)
 def update_cart(request, item_id):
-    """Update cart item quantity"""
+    """Update cart item quantity
+
+    ``item_id`` is a CartItem, or for logged-out visitors a product.
+    """
+    quantity = _posted_quantity(request)
+    
+    if not request.user.is_authenticated:
+        cart = get_anonymous_cart(request)
+        if item_id not in cart:
+            raise Http404('No such item in the cart.')
+        product = get_object_or_404(Product, id=item_id)
+        if quantity is not None and quantity <= product.stock_quantity:
+            cart.update(product.id, quantity)
+            messages.success(request, 'Cart updated successfully!')
+        else:
+            messages.error(request, 'Invalid quantity.')
+        return redirect('shop:cart')
+    
     cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    quantity = int(request.POST.get('quantity', 1))
     
-    if quantity > 0 and quantity <= cart_item.product.stock_quantity:
+    if quantity is not None and quantity <= cart_item.product.stock_quantity:
         cart_item.quantity = quantity
         cart_item.save()
+        refresh_cart_count(request.user)
         messages.success(request, 'Cart updated successfully!')
     else:
         messages.error(request, 'Invalid quantity.')
@@ -131,21 +232,56 @@ def update_cart(request, item_id):
     return redirect('shop:cart')
 
 
-@login_required
+@query_budget(7)
 def remove_from_cart(request, item_id):
-    """Remove item from cart"""
+    """Remove item from cart
+
+    ``item_id`` is a CartItem, or for logged-out visitors a product.
+    """
+    if not request.user.is_authenticated:
+        cart = get_anonymous_cart(request)
+        if item_id not in cart:
+            raise Http404('No such item in the cart.')
+        cart.remove(item_id)
+        messages.success(request, 'Item removed from cart.')
+        return redirect('shop:cart')
+    
     cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     product_name = cart_item.product.name
     cart_item.delete()
+    refresh_cart_count(request.user)
     messages.success(request, f'{product_name} removed from cart.')
     return redirect('shop:cart')
 
 
-@login_required
-def checkout(request):
-    """Checkout view"""
-    cart = get_object_or_404(Cart, user=request.user)
-    cart_items = cart.items.all()
+def _checkout_page(request, cart_items):
+    cart = cart_items[0].cart
+    context = {
+        'cart': cart,
+        'cart_items': cart_items,
+        'summary': cart.summary,
+        'stripe_public_key': settings.STRIPE_PUBLIC_KEY,
+    }
+    return render(request, 'shop/checkout.html', context)
+
+
+# Placing an order runs one stock UPDATE per cart line
+@query_budget(7, post=24)
+async def checkout(request):
+    """Checkout view
+
+    Async so that, under ASGI, awaiting the payment gateway doesn't hold a
+    worker while the provider responds. Database work runs in sync helpers.
+    """
+    user = await request.auser()
+    # auser() and request.user cache separately; let the templates reuse this one
+    request.user = user
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    
+    cart_items = [
+        item async for item in CartItem.objects.filter(cart__user=user).select_related('cart', 'product')
+    ]
     
     if not cart_items:
         messages.error(request, 'Your cart is empty.')
@@ -154,87 +290,61 @@ def checkout(request):
     if request.method == 'POST':
         try:
             # Get form data
-            delivery_name = request.POST.get('delivery_name')
-            delivery_phone = request.POST.get('delivery_phone')
-            delivery_address = request.POST.get('delivery_address')
-            delivery_city = request.POST.get('delivery_city')
-            delivery_state = request.POST.get('delivery_state')
-            delivery_postal_code = request.POST.get('delivery_postal_code')
-            stripe_token = request.POST.get('stripeToken')
+            delivery = {
+                'delivery_name': request.POST.get('delivery_name'),
+                'delivery_phone': request.POST.get('delivery_phone'),
+                'delivery_address': request.POST.get('delivery_address'),
+                'delivery_city': request.POST.get('delivery_city'),
+                'delivery_state': request.POST.get('delivery_state'),
+                'delivery_postal_code': request.POST.get('delivery_postal_code'),
+            }
+            payment_token = request.POST.get('stripeToken')
             
-            # Calculate total
-            subtotal = cart.subtotal
-            shipping = 0 if subtotal >= 999 else 50
-            total = subtotal + shipping
+            # Create the order and reserve stock before charging
+            try:
+                order = await sync_to_async(place_order)(user, cart_items, delivery)
+            except OutOfStock as e:
+                messages.error(request, f'Sorry, {e.product.name} no longer has enough stock.')
+                return redirect('shop:cart')
             
-            # Create Stripe charge (in test mode)
+            # Take payment without blocking other requests
             try:
-                charge = stripe.Charge.create(
-                    amount=int(total * 100),  # Amount in paise
+                payment_id = await get_gateway().acharge(
+                    amount=int(order.total_amount * 100),  # Amount in paise
                     currency='inr',
-                    source=stripe_token,
-                    description=f'Order for {request.user.username}'
+                    source=payment_token,
+                    description=f'Order for {user.username}',
                 )
-                stripe_payment_id = charge.id
-            except stripe.error.CardError as e:
+            except Exception as e:
+                # Whatever went wrong, the reserved stock goes back on sale
+                if not isinstance(e, PaymentError):
+                    logger.exception('Payment gateway failed for order %s', order.order_number)
+                await sync_to_async(cancel_order)(order)
                 messages.error(request, 'Payment failed. Please try again.')
                 return redirect('shop:checkout')
             
-            # Create order
-            order = Order.objects.create(
-                user=request.user,
-                total_amount=total,
-                delivery_name=delivery_name,
-                delivery_phone=delivery_phone,
-                delivery_address=delivery_address,
-                delivery_city=delivery_city,
-                delivery_state=delivery_state,
-                delivery_postal_code=delivery_postal_code,
-                stripe_payment_id=stripe_payment_id,
-                payment_status='completed',
-                status='processing'
-            )
-            
-            # Create order items
-            for item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price_snapshot=item.product.price
-                )
-                # Update stock
-                item.product.stock_quantity -= item.quantity
-                item.product.save()
-            
-            # Clear cart
-            cart_items.delete()
-            
-            # Send confirmation email (console backend)
-            send_mail(
-                subject=f'Order Confirmation - {order.order_number}',
-                message=f'Thank you for your order! Your order number is {order.order_number}. Total amount: ₹{order.total_amount}',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[request.user.email],
-                fail_silently=True,
-            )
+            try:
+                await sync_to_async(complete_order)(order, payment_id, cart_items)
+            except Exception:
+                logger.exception('Could not complete order %s after payment %s; it needs refunding',
+                                 order.order_number, payment_id)
+                await sync_to_async(cancel_order)(order)
+                messages.error(request, 'We could not complete your order and will refund any payment taken.')
+                return redirect('shop:checkout')
+            await sync_to_async(set_cart_count)(user, 0)
             
             messages.success(request, 'Order placed successfully!')
             return redirect('shop:order_confirmation', order_id=order.id)
             
-        except Exception as e:
-            messages.error(request, f'An error occurred: {str(e)}')
+        except Exception:
+            logger.exception('Checkout failed for %s', user.username)
+            messages.error(request, 'Something went wrong placing your order. Please try again.')
             return redirect('shop:checkout')
     
-    context = {
-        'cart': cart,
-        'cart_items': cart_items,
-        'stripe_public_key': settings.STRIPE_PUBLIC_KEY,
-        'categories': Category.objects.filter(is_active=True),
-    }
-    return render(request, 'shop/checkout.html', context)
+    return await sync_to_async(_checkout_page)(request, cart_items)
 
 
+@query_budget(6)
 @login_required
 def order_confirmation(request, order_id):
     """Order confirmation view"""
@@ -242,23 +352,31 @@ def order_confirmation(request, order_id):
     
     context = {
         'order': order,
-        'categories': Category.objects.filter(is_active=True),
     }
     return render(request, 'shop/order_confirmation.html', context)
 
 
+@query_budget(6)
 @login_required
 def order_history(request):
     """Order history view"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    # A correlated subquery rather than a JOIN/GROUP BY lets the index on
+    # (user, created_at, id) drive the scan, so only one page's counts are computed.
+    item_count = (OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+                  .values('order').annotate(count=Count('*')).values('count'))
+    orders = Order.objects.filter(user=request.user).annotate(
+        item_count=Coalesce(Subquery(item_count), 0))
+    page = KeysetPaginator(orders, ORDERS_PER_PAGE).get_page(
+        after=request.GET.get('after'), before=request.GET.get('before'))
     
     context = {
-        'orders': orders,
-        'categories': Category.objects.filter(is_active=True),
+        'orders': page.object_list,
+        'page': page,
     }
     return render(request, 'shop/order_history.html', context)
 
 
+@query_budget(6)
 @login_required
 def order_detail(request, order_id):
     """Order detail view"""
@@ -266,6 +384,5 @@ def order_detail(request, order_id):
     
     context = {
         'order': order,
-        'categories': Category.objects.filter(is_active=True),
     }
     return render(request, 'shop/order_confirmation.html', context)